@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Any, Callable
+
+import pygame
+
+from camera import Camera
+from file_manager import BASE_PREFERENCES, encode_save, load_game
+from generate_world import generate_world
+from map_object import Map
+from renderer import Compositor
+from simulation import Simulation
+from stress_city import build_stress_city
+from utils import DEFAULT_MAP_SETTINGS, VERSION
+
+# Generated cities (layout, size), as well as every save, so there's always something bigger than the hand built saves to time
+SYNTHETIC_CITIES = {"Synthetic_grid_128": ("grid", 128), "Synthetic_radial_128": ("radial", 128), "Synthetic_maze_128": ("maze", 128)}
+BENCHMARK_WINDOW_SIZE = (1710, 870)  # The game's starting window size
+REGRESSION_THRESHOLD = 0.25  # How much slower than the baseline (as a fraction) counts as a regression
+MIN_REGRESSION_TIME = 0.002  # Seconds, anything quicker than this is too noisy to call a regression
+
+BenchmarkResultsType = dict[str, dict[str, float]]  # Case name -> timing name -> seconds
+
+
+def best_time(function: Callable[[], Any], repeats: int) -> float:
+    """The quickest of repeats runs in seconds, the quickest is the one least affected by anything else running"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_map(name: str, load: Callable[[], Map], window: pygame.surface.Surface, ticks: int, route_count: int, repeats: int) -> dict[str, float]:
+    """Times everything for one world, the simulation goes last because it changes the map"""
+    results = {"load": best_time(load, repeats)}
+    map = load()
+    results["save"] = best_time(lambda: encode_save(*map.to_arrays()), repeats)
+    map_settings = DEFAULT_MAP_SETTINGS | {"legacy_generation": True} | map.settings  # Old saves are missing newer settings
+    results["generate_world"] = best_time(lambda: generate_world(map_settings), repeats)
+    results["check_connected"] = best_time(map.check_connected, repeats)
+
+    roads = map.get_all_tiles_by_type("Road") or []
+    if len(roads) >= 2:
+        pair_rng = random.Random(0)
+        pairs = [tuple(pair_rng.sample(roads, 2)) for _ in range(route_count)]
+        results["generate_route"] = best_time(lambda: [map.generate_route(start, end) for start, end in pairs], repeats) / route_count
+
+    compositor, camera = Compositor(window), Camera()
+    map.reset_map(compositor, camera)
+
+    def redraw() -> None:
+        map.redraw_entire_map()
+        for x, y, tile in map.iter():
+            if tile.redraw:
+                tile.type.draw(compositor, camera, map, x, y, "general_view", old_roads=False)
+        compositor.draw_lod(camera, map)
+    results["redraw"] = best_time(redraw, repeats)
+
+    map.rng.seed(0)
+    simulation = Simulation(map, BASE_PREFERENCES)
+
+    def simulate() -> None:
+        for _ in range(ticks):
+            simulation.tick()
+    results["simulate"] = best_time(simulate, 1)
+    results["tick"] = results["simulate"] / ticks
+
+    print(f"benchmark: {name} ({map.width}x{map.height}) " + ", ".join(f"{timing} {seconds*1000:.1f}ms" for timing, seconds in results.items()))
+    return results
+
+
+def run_benchmarks(case_names: list[str] | None = None, ticks: int = 100, route_count: int = 20, repeats: int = 3) -> BenchmarkResultsType:
+    """Every save in saves/ (apart from autosaves) and every synthetic city, or just the ones named"""
+    pygame.display.init()
+    window = pygame.display.set_mode(BENCHMARK_WINDOW_SIZE)
+
+    cases: dict[str, Callable[[], Map]] = {
+        save_name.removesuffix(".simcity"): lambda save_name=save_name: load_game(save_name, attach_journal=False)  # type: ignore[misc]
+        for save_name in sorted(os.listdir("saves")) if save_name.endswith(".simcity") and not save_name.startswith("Autosave_")
+    }
+    cases |= {name: lambda city=city: build_stress_city(*city) for name, city in SYNTHETIC_CITIES.items()}  # type: ignore[misc]
+    if case_names:
+        for name in set(case_names) - set(cases):
+            print(f"benchmark: No save or synthetic city called {name}")
+        cases = {name: load for name, load in cases.items() if name in case_names}
+    return {name: benchmark_map(name, load, window, ticks, route_count, repeats) for name, load in cases.items()}
+
+
+def compare_to_baseline(results: BenchmarkResultsType, baseline: BenchmarkResultsType, threshold: float = REGRESSION_THRESHOLD,
+                        skip: tuple[str, ...] = ()) -> list[str]:
+    """Returns a line for every timing (apart from skip) that's more than threshold slower than the baseline"""
+    regressions = []
+    for name, timings in results.items():
+        for timing, seconds in timings.items():
+            old_seconds = baseline.get(name, {}).get(timing)
+            if old_seconds is None or timing in skip:
+                continue
+            if seconds > old_seconds * (1 + threshold) and seconds - old_seconds > MIN_REGRESSION_TIME:
+                regressions.append(f"{name} {timing}: {old_seconds*1000:.1f}ms -> {seconds*1000:.1f}ms ({seconds / old_seconds - 1:+.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the game's slow parts on every save and some generated cities, run from the game's folder")
+    parser.add_argument("cases", nargs="*", help="Only run these saves (without .simcity) or synthetic cities")
+    parser.add_argument("--ticks", type=int, default=100, help="Ticks to simulate for each world")
+    parser.add_argument("--routes", type=int, default=20, help="Random pairs of roads to find routes between for each world")
+    parser.add_argument("--repeats", type=int, default=3, help="Times to repeat each timing, the quickest is kept")
+    parser.add_argument("--output", default="benchmarks/latest.json", help="Where to write the results")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json",
+                        help="Results to compare against, if the file exists. Timings only compare on the same machine, so make your own with --save-baseline first")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline too")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Fraction slower than the baseline that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 if anything is slower than the baseline")
+    args = parser.parse_args()
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # No window needs to be shown, pygame reads this when the display starts
+
+    results = run_benchmarks(args.cases, args.ticks, args.routes, args.repeats)
+    report = {
+        "version": VERSION, "python": platform.python_version(), "machine": platform.machine(),
+        "ticks": args.ticks, "routes": args.routes, "results": results,
+    }
+    os.makedirs("benchmarks", exist_ok=True)
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        print(f"benchmark: Wrote {path}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        sys.exit(0)
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    skip: tuple[str, ...] = ()
+    if baseline["ticks"] != args.ticks:
+        print("benchmark: The baseline was run with a different --ticks, only the time per tick is compared")
+        skip = ("simulate",)  # The total for all the ticks, generate_route is already per route
+    regressions = compare_to_baseline(results, baseline["results"], args.threshold, skip)
+    for regression in regressions:
+        print(f"benchmark: REGRESSION {regression}")
+    print(f"benchmark: {len(regressions)} regressions against {args.baseline}")
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pygame
+
+from entities import rotated_entities_cache
+from utils import ICON_SIZE, IMAGES, TILE_WIDTH
+
+if TYPE_CHECKING:
+    from map_object import Map
+
+ZOOM_LEVELS = (2, 4, 8, 16, 32, 64)  # Pixels per tile
+DEFAULT_ZOOM_LEVEL = ZOOM_LEVELS.index(TILE_WIDTH)
+LOD_TILE_WIDTH = 4  # At or below this, tiles are drawn as one colour each from an array, rather than as textures
+PAN_SPEED = TILE_WIDTH  # Pixels moved per frame while a movement key is held
+
+
+def scale_image(image: pygame.surface.Surface, tile_width: int) -> pygame.surface.Surface:
+    scale = tile_width / TILE_WIDTH
+    return pygame.transform.scale(image, (max(1, round(image.get_width() * scale)), max(1, round(image.get_height() * scale))))
+
+
+# Every tile and entity image, pre-scaled for each zoom level, keyed by the original image
+TEXTURE_SETS: dict[int, dict[pygame.surface.Surface, pygame.surface.Surface]] = {
+    tile_width: {
+        image: image if tile_width == TILE_WIDTH else scale_image(image, tile_width)
+        for image in [image for name, image in IMAGES.items() if not name.endswith("_icon")] + list(rotated_entities_cache.values())
+    }
+    for tile_width in ZOOM_LEVELS
+}
+
+
+class Camera:
+    """
+    Holds where the map is drawn on screen and how zoomed in it is, and converts between tile coords and screen positions
+    """
+
+    def __init__(self) -> None:
+        self.x_offset = 0
+        self.y_offset = 0
+        self.zoom_level = DEFAULT_ZOOM_LEVEL
+
+    def __repr__(self) -> str:
+        return f"Camera({self.x_offset=}, {self.y_offset=}, {self.tile_width=})"
+
+    @property
+    def tile_width(self) -> int:
+        return ZOOM_LEVELS[self.zoom_level]
+
+    @property
+    def is_lod(self) -> bool:
+        return self.tile_width <= LOD_TILE_WIDTH
+
+    def scaled(self, image: pygame.surface.Surface) -> pygame.surface.Surface:
+        """Returns the version of the image for the current zoom level"""
+        texture_set = TEXTURE_SETS[self.tile_width]
+        if image not in texture_set:  # Something that wasn't loaded at startup
+            texture_set[image] = scale_image(image, self.tile_width)
+        return texture_set[image]
+
+    # =============================================================================
+    def center(self, map: Map, window: pygame.surface.Surface) -> None:
+        self.x_offset = window.get_width() // 2 - (self.tile_width * map.width // 2) - self.tile_width
+        self.y_offset = window.get_height() // 2 - (self.tile_width * map.height // 2) - self.tile_width
+
+    def pan(self, x_change: int, y_change: int, map: Map, window: pygame.surface.Surface) -> None:
+        # Only move the offset if the new position is within the map
+        if -map.width * self.tile_width <= self.x_offset + x_change <= window.get_width():
+            self.x_offset += x_change
+        if -map.height * self.tile_width <= self.y_offset + y_change <= window.get_height():
+            self.y_offset += y_change
+
+    def zoom(self, zoom_change: int, anchor_x: int, anchor_y: int) -> bool:
+        """
+        Zooms in (positive) or out (negative), keeping whatever is under the anchor position in place.
+        Returns whether the zoom level actually changed
+        """
+        new_zoom_level = min(max(self.zoom_level + zoom_change, 0), len(ZOOM_LEVELS) - 1)
+        if new_zoom_level == self.zoom_level:
+            return False
+        old_tile_width, self.zoom_level = self.tile_width, new_zoom_level
+        self.x_offset = anchor_x - (anchor_x - self.x_offset) * self.tile_width // old_tile_width
+        self.y_offset = anchor_y - (anchor_y - self.y_offset) * self.tile_width // old_tile_width
+        return True
+
+    # =============================================================================
+    def coords_to_screen_pos(self, x: int, y: int) -> tuple[int, int]:
+        return ((x * self.tile_width)+self.x_offset, (y * self.tile_width)+self.y_offset)
+
+    def screen_pos_to_coords(self, x: int | None, y: int | None, map: Map, window: pygame.surface.Surface) -> tuple[int, int] | tuple[None, None]:
+        if x is None or y is None or x > (window.get_width() - ICON_SIZE*1.5) or y > (window.get_height() - ICON_SIZE*1.5):
+            return None, None
+        tile_x, tile_y = (x-self.x_offset) // self.tile_width, (y-self.y_offset) // self.tile_width
+        if not (0 <= tile_x < map.width and 0 <= tile_y < map.height):
+            return None, None
+        return tile_x, tile_y
+
+    def visible_tiles(self, map: Map, window: pygame.surface.Surface) -> tuple[int, int, int, int]:
+        """Returns the first and last (exclusive) x and y of the tiles that are on screen"""
+        first_x = min(max(-self.x_offset // self.tile_width, 0), map.width)
+        first_y = min(max(-self.y_offset // self.tile_width, 0), map.height)
+        last_x = min(max((window.get_width() - self.x_offset) // self.tile_width + 1, 0), map.width)
+        last_y = min(max((window.get_height() - self.y_offset) // self.tile_width + 1, 0), map.height)
+        return first_x, first_y, last_x, last_y
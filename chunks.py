@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any
+
+import numpy as np
+
+from classes import (TILE_TYPE_NAMES, abandoned_tile, dirt, get_type_by_name,
+                     grass, lily_pad, sand, shrub, tree, water, weeds)
+from perlin import generate_height_map
+from utils import MapSettingsType, smooth_field
+
+FLOORING_TO_PLANT = {
+    "Grass": tree,
+    "Sand": shrub,
+    "Dirt": weeds,
+    "Gravel": weeds,
+    "Water": lily_pad,
+}
+
+IntArray = np.ndarray[Any, np.dtype[np.int64]]
+ChunkType = dict[str, np.ndarray[Any, Any]]  # The "type", "height_map" and "water" arrays of an area
+
+CHUNK_SIZE = 32  # New worlds are made in CHUNK_SIZE squares, each only depends on the seed and where it is
+WATER_SMOOTHING_PASSES = 10  # Also how far water can spread, so how far past its edges a chunk has to look
+PARALLEL_CHUNKS = 16  # Below this many chunks, starting the worker processes takes longer than just generating them
+GENERATION_WORKERS = os.cpu_count() or 1
+MAX_CACHED_CHUNKS = 256  # About 3MB, chunks used longest ago get dropped past this, and just get generated again if they're needed
+
+# Generation works on arrays of tile type ids (the same ids saves use), these turn a whole array of ids into something at once
+TYPE_IDS = {name: type_id for type_id, name in enumerate(TILE_TYPE_NAMES)}
+PLANT_IDS = np.array([TYPE_IDS[FLOORING_TO_PLANT[name].name] if name in FLOORING_TO_PLANT else type_id for type_id, name in enumerate(TILE_TYPE_NAMES)])
+CAN_PLACE_ON = np.array([bool(get_type_by_name(name).can_place_on) for name in TILE_TYPE_NAMES])
+
+
+def generate_tile_type_ids(height_map: np.ndarray[Any, Any], include_water: bool) -> IntArray:
+    """generate_tile_type for a whole height map"""
+    return np.select(
+        [height_map > 0.3, height_map > 0, include_water & (height_map <= -0.6)],
+        [TYPE_IDS[sand.name], TYPE_IDS[dirt.name], TYPE_IDS[water.name]],
+        TYPE_IDS[grass.name],
+    )
+
+
+def chunk_rng(seed: int, chunk_x: int, chunk_y: int, stream: int) -> np.random.Generator:
+    return np.random.default_rng([seed % 2**64, chunk_x % 2**32, chunk_y % 2**32, stream])
+
+
+def area_tree_rolls(seed: int, x: int, y: int, width: int, height: int) -> IntArray:
+    """Each tile's 1 to 100 roll for whether it gets a plant, every chunk rolls all its tiles so they're the same whatever area asks"""
+    rolls = np.empty((width, height), dtype=np.int64)
+    for chunk_x in range(x // CHUNK_SIZE, (x + width - 1) // CHUNK_SIZE + 1):
+        for chunk_y in range(y // CHUNK_SIZE, (y + height - 1) // CHUNK_SIZE + 1):
+            chunk_rolls = chunk_rng(seed, chunk_x, chunk_y, 0).integers(1, 101, size=(CHUNK_SIZE, CHUNK_SIZE))
+            x1, y1 = max(x, chunk_x * CHUNK_SIZE), max(y, chunk_y * CHUNK_SIZE)
+            x2, y2 = min(x + width, (chunk_x + 1) * CHUNK_SIZE), min(y + height, (chunk_y + 1) * CHUNK_SIZE)
+            rolls[x1 - x:x2 - x, y1 - y:y2 - y] = chunk_rolls[x1 - chunk_x * CHUNK_SIZE:x2 - chunk_x * CHUNK_SIZE, y1 - chunk_y * CHUNK_SIZE:y2 - chunk_y * CHUNK_SIZE]
+    return rolls
+
+
+def generate_chunk(map_settings: MapSettingsType, seed: int, chunk_x: int, chunk_y: int) -> ChunkType:
+    """
+    The type, height_map and water arrays of a chunk, which only depend on the seed, the generation settings and where it is,
+    so chunks can be made in any order, in other processes, or again on their own. World coords can go past any map's edges
+    """
+    x, y = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+    # Water spreads from nearby chunks, so the area around it gets made too, then cut off at the end
+    area_x, area_y = x - WATER_SMOOTHING_PASSES, y - WATER_SMOOTHING_PASSES
+    area = (CHUNK_SIZE + 2 * WATER_SMOOTHING_PASSES, CHUNK_SIZE + 2 * WATER_SMOOTHING_PASSES)
+
+    if map_settings["generate_biomes"]:
+        height_map = generate_height_map(*area, seed, x=area_x, y=area_y)
+    else:
+        height_map = np.full(area, -0.5)
+    type_ids = generate_tile_type_ids(height_map, include_water=map_settings["generate_lakes"])
+    tree_rolls = area_tree_rolls(seed, area_x, area_y, *area)
+    type_ids = np.where(tree_rolls < map_settings["tree_density"], PLANT_IDS[type_ids], type_ids)
+    # All at once rather than sweeping, sweeping depends on everything before it in the whole map
+    water_map = smooth_field(np.where(type_ids == TYPE_IDS[water.name], 10_000_000, 0), WATER_SMOOTHING_PASSES, minimum=0, maximum=255, sweep=False)
+
+    inside = (slice(WATER_SMOOTHING_PASSES, -WATER_SMOOTHING_PASSES), slice(WATER_SMOOTHING_PASSES, -WATER_SMOOTHING_PASSES))
+    height_map, type_ids, water_map = height_map[inside], type_ids[inside], water_map[inside]
+
+    if map_settings["generate_ruins"]:
+        rng = chunk_rng(seed, chunk_x, chunk_y, 1)
+        ruin_count = (CHUNK_SIZE*CHUNK_SIZE) // 144
+        ruin_xs, ruin_ys = rng.integers(0, CHUNK_SIZE, size=ruin_count), rng.integers(0, CHUNK_SIZE, size=ruin_count)
+        ruins_placed = CAN_PLACE_ON[type_ids[ruin_xs, ruin_ys]]
+        type_ids[ruin_xs[ruins_placed], ruin_ys[ruins_placed]] = TYPE_IDS[abandoned_tile.name]
+
+    return {"type": type_ids.astype(np.uint8), "height_map": height_map, "water": water_map.astype(np.int32)}
+
+
+class ChunkStore:
+    """
+    The terrain for any world coord, generated from the seed a chunk at a time the first time it's needed, and cached.
+    Only the MAX_CACHED_CHUNKS most recently used chunks are kept, so memory follows the area that's actually being looked at
+    """
+
+    def __init__(self, map_settings: MapSettingsType, seed: int, max_chunks: int = MAX_CACHED_CHUNKS) -> None:
+        self.map_settings = map_settings
+        self.seed = seed
+        self.max_chunks = max_chunks
+        self.chunks: OrderedDict[tuple[int, int], ChunkType] = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"ChunkStore({self.seed=}, {len(self.chunks)=})"
+
+    def generate_chunks(self, chunks: list[tuple[int, int]]) -> None:
+        """Makes any of these chunks that aren't cached yet, in worker processes if there's a lot of them"""
+        missing = [chunk for chunk in dict.fromkeys(chunks) if chunk not in self.chunks]
+        chunk_xs, chunk_ys = [chunk_x for chunk_x, _ in missing], [chunk_y for _, chunk_y in missing]
+        # Only forked workers, others would start by re-running main.py
+        if GENERATION_WORKERS > 1 and len(missing) >= PARALLEL_CHUNKS and "fork" in multiprocessing.get_all_start_methods():
+            with ProcessPoolExecutor(max_workers=GENERATION_WORKERS, mp_context=multiprocessing.get_context("fork")) as pool:
+                results = list(pool.map(generate_chunk, repeat(self.map_settings), repeat(self.seed), chunk_xs, chunk_ys, chunksize=4))
+        else:
+            results = list(map(generate_chunk, repeat(self.map_settings), repeat(self.seed), chunk_xs, chunk_ys))
+        self.chunks.update(zip(missing, results))
+
+    def get_chunk(self, chunk_x: int, chunk_y: int) -> ChunkType:
+        if (chunk_x, chunk_y) not in self.chunks:
+            self.generate_chunks([(chunk_x, chunk_y)])
+        self.chunks.move_to_end((chunk_x, chunk_y))
+        return self.chunks[chunk_x, chunk_y]
+
+    def get_area(self, x: int, y: int, width: int, height: int) -> ChunkType:
+        """The type, height_map and water arrays of the width by height area starting at world coord (x, y), stitched from chunks"""
+        chunks = [(chunk_x, chunk_y) for chunk_x in range(x // CHUNK_SIZE, (x + width - 1) // CHUNK_SIZE + 1)
+                  for chunk_y in range(y // CHUNK_SIZE, (y + height - 1) // CHUNK_SIZE + 1)]
+        self.generate_chunks(chunks)
+
+        area: ChunkType = {}
+        for chunk_x, chunk_y in chunks:
+            chunk = self.get_chunk(chunk_x, chunk_y)
+            x1, y1 = max(x, chunk_x * CHUNK_SIZE), max(y, chunk_y * CHUNK_SIZE)
+            x2, y2 = min(x + width, (chunk_x + 1) * CHUNK_SIZE), min(y + height, (chunk_y + 1) * CHUNK_SIZE)
+            for field, values in chunk.items():
+                if field not in area:
+                    area[field] = np.empty((width, height), dtype=values.dtype)
+                area[field][x1 - x:x2 - x, y1 - y:y2 - y] = values[x1 - chunk_x * CHUNK_SIZE:x2 - chunk_x * CHUNK_SIZE, y1 - chunk_y * CHUNK_SIZE:y2 - chunk_y * CHUNK_SIZE]
+
+        while len(self.chunks) > max(self.max_chunks, len(chunks)):  # Never drop chunks this area is still using
+            self.chunks.popitem(last=False)
+        return area
@@ -1,19 +1,30 @@
 from __future__ import annotations
 
-import random
 from typing import TYPE_CHECKING, Any
 
 import pygame
 
 # from need_calculator import calculate_happiness
-from utils import (DESIRED_FPS, ICON_SIZE, IMAGES, TILE_WIDTH,  # rot_center
-                   coords_to_screen_pos, get_neighbouring_road_string)
+from utils import (DESIRED_FPS, ICON_SIZE, IMAGES,  # rot_center
+                   get_neighbouring_road_string)
 
 COLOUR_TYPE = tuple[int, int, int]
+FIRE_LOD_COLOUR = (255, 80, 0)
 
 if TYPE_CHECKING:
+    from camera import Camera
     from entities import Person
     from map_object import Map
+    from renderer import Compositor
+
+average_colours: dict[pygame.surface.Surface, COLOUR_TYPE] = {}
+
+
+def get_average_colour(image: pygame.surface.Surface) -> COLOUR_TYPE:
+    """Used when zoomed far out, where each tile is drawn as a single colour"""
+    if image not in average_colours:
+        average_colours[image] = pygame.transform.average_color(image)[:3]  # type: ignore[assignment]
+    return average_colours[image]
 
 
 class GenericTile:
@@ -56,26 +67,41 @@ class GenericTile:
 
     # =============================================================================
     # DRAWING
-    def draw(self, window: pygame.surface.Surface, map: Map, x: int, y: int, view: str, old_roads: bool, x_offset: int, y_offset: int) -> None:
-        x_pos, y_pos = pos = coords_to_screen_pos(x, y, x_offset, y_offset)
-        if not (0 <= x_pos < window.get_width()-ICON_SIZE-TILE_WIDTH and 0 <= y_pos < window.get_height()-ICON_SIZE):
+    def draw(self, compositor: Compositor, camera: Camera, map: Map, x: int, y: int, view: str, old_roads: bool) -> None:
+        if camera.is_lod:  # Zoomed far out, the compositor draws the whole map from an array of colours in one go
+            map[x, y].redraw = False
+            compositor.set_lod_colour(map, x, y, self.get_lod_colour(map, x, y, view, old_roads))
             return
-        map[x, y].redraw = False
 
+        x_pos, y_pos = pos = camera.coords_to_screen_pos(x, y)
+        map[x, y].redraw = False  # Even if it's off screen, moving the camera redraws the entire map anyway
+        if not (0 <= x_pos < compositor.window.get_width()-ICON_SIZE-camera.tile_width and 0 <= y_pos < compositor.window.get_height()-ICON_SIZE):
+            return
+        if view == "crazy_view":
+            return  # Crazy works by just letting things draw over each other.
+
+        tile_rect = pygame.Rect(x_pos, y_pos, camera.tile_width, camera.tile_width)
+        compositor.status.fill((0, 0, 0, 0), tile_rect)
         if view == "general_view":
             general_image = self.get_general_view_texture(map, x, y, old_roads)
-            window.blit(general_image, pos)
+            compositor.terrain.blit(camera.scaled(general_image), pos)
             if map[x, y].fire_ticks is not None:
-                window.blit(IMAGES["fire"], pos)
+                compositor.status.blit(camera.scaled(IMAGES["fire"]), pos)
             if len(map[x, y].error_list) > 0:
-                window.blit(IMAGES["errorsquare"], pos)
-            return
-        if view == "crazy_view":
-            return  # Crazy works by just letting things draw over each other.
+                compositor.status.blit(camera.scaled(IMAGES["errorsquare"]), pos)
+        else:
+            func = getattr(self, "draw_" + view)
+            tile_colour = func(map[x, y])
+            pygame.draw.rect(compositor.terrain, tile_colour, tile_rect)
+        compositor.restore(tile_rect)
 
+    def get_lod_colour(self, map: Map, x: int, y: int, view: str, old_roads: bool) -> COLOUR_TYPE:
+        if view in ("general_view", "crazy_view"):
+            if map[x, y].fire_ticks is not None:
+                return FIRE_LOD_COLOUR
+            return get_average_colour(self.get_general_view_texture(map, x, y, old_roads))
         func = getattr(self, "draw_" + view)
-        tile_colour = func(map[x, y])
-        pygame.draw.rect(window, tile_colour, (*pos, TILE_WIDTH, TILE_WIDTH))
+        return func(map[x, y])  # type: ignore[no-any-return]
 
     def get_general_view_texture(self, map: Map, x: int, y: int, old_roads: bool) -> pygame.Surface:  # Leave types for typing.
         return IMAGES[self.general_view_image]  # .convert()
@@ -150,6 +176,7 @@ class GenericTile:
         assert self.cost is not None
         map.cash -= self.cost
         map[x, y].type = self
+        map.mark_changed(x, y)
         return None
 
     def on_matrix_place(self, map: Map) -> None:
@@ -177,6 +204,7 @@ class GenericTile:
         if map[x, y].fire_ticks is not None and map[x, y].fire_ticks >= DESIRED_FPS * 10:  # type: ignore[operator]
             map[x, y].type = abandoned_tile
             map[x, y].fire_ticks = None
+            map.mark_changed(x, y)
         map[x, y].redraw = True
 
     # =============================================================================
@@ -256,8 +284,9 @@ class Zoning(GenericTile):
 
     def on_random_tick(self, map: Map, x: int, y: int) -> None:
         super().on_random_tick(map, x, y)
-        if random.randint(1, 25) == 1 and map[x, y].road >= 2:
+        if map.rng.randint(1, 25) == 1 and map[x, y].road >= 2:
             map[x, y].type = self.turns_to
+            map.mark_changed(x, y)
 
 
 class HouseZoning(Zoning):
@@ -406,6 +435,7 @@ class Dirt(GenericTile):
         # The cost will always be an int here
         map.cash -= self.cost
         map[x, y].type = self
+        map.mark_changed(x, y)
         return None
 
     # def on_random_tick(self, map: Map, x: int, y: int) -> None:
@@ -523,6 +553,7 @@ ALL_TILES = [
     (dirt := Dirt()),
     (entry_road := EntryRoad()),
 ]
+TILE_TYPE_NAMES = list(dict.fromkeys(x.name for x in ALL_TILES))  # A tile type's id in type arrays is its index in here
 ICON_LIST = [x.icon for x in ALL_TILES if x.cost is not None and x.name not in ("Road", "House", "Shop", "Office")]
 
 ZONED_BUILDINGS = ("House", "Shop", "Office")
@@ -1,15 +1,16 @@
 from __future__ import annotations
 
-from random import randint
+from random import Random
 from typing import TYPE_CHECKING, TypedDict
 
-import pygame
-
+from metrics import METRICS
 from utils import (ICON_SIZE, IMAGES, TILE_WIDTH, DeleteEntity,
                    get_random_name, rot_center)
 
 if TYPE_CHECKING:
+    from camera import Camera
     from map_object import Map
+    from renderer import Compositor
 
 
 # LOCATION_TYPES = ["Spawn", "House", "Shop", "Office", "Park"]
@@ -27,7 +28,7 @@ LOCATION_TYPE = tuple[int, int]
 
 def create_route(map: Map, route_type: str) -> tuple[None, None] | tuple[tuple[int, int] | None, tuple[int, int] | None]:
     routes = ROUTES_CHANCES[route_type]
-    random_num = randint(1, routes[-1][0])
+    random_num = map.rng.randint(1, routes[-1][0])
 
     for route in routes:
         if random_num <= route[0]:
@@ -64,7 +65,7 @@ class Entity:
     direction_offsets = {"LEFT": (0, 0, 0)}
 
     def __init__(self, entity_subtype: str, map: Map, start: tuple[int, int], end: tuple[int, int], rainbow: bool = False, enforce_minimum_distance: bool = False, route: list[LOCATION_TYPE] | None = None) -> None:
-        self.entity_subtype = randint(1, num_of_entity_sprites[self.__class__.__name__]) if rainbow else entity_subtype
+        self.entity_subtype = map.rng.randint(1, num_of_entity_sprites[self.__class__.__name__]) if rainbow else entity_subtype
 
         self.start = start
         self.end = end
@@ -76,6 +77,7 @@ class Entity:
         if not (5 <= len(self.path) < self.__class__.max_path_length) and enforce_minimum_distance:
             # If the path is too short, or too long, delete the entity
             raise DeleteEntity
+        METRICS.increment("entities_spawned")
 
     def __str__(self) -> str:
         return f"{self.__class__.__name__} object (of type {self.entity_subtype}) from {self.start} to {self.end}"
@@ -89,6 +91,7 @@ class Entity:
         try:
             new_entity: Vehicle | Pedestrian = class_type(route_type, map, start, end, rainbow=rainbow_entities_enabled, enforce_minimum_distance=True)
         except DeleteEntity:
+            METRICS.increment("entities_rejected")
             return
 
         entity_list: list[Vehicle] | list[Pedestrian] = map.entity_lists[new_entity.__class__.__name__]  # type: ignore[literal-required]
@@ -96,7 +99,6 @@ class Entity:
         entity_list.append(new_entity)  # type: ignore[arg-type]
 
     def update(self, map: Map, entity_list: list[Vehicle | Pedestrian]) -> tuple[int, int] | None:
-        map[self.current_loc[0], self.current_loc[1]].redraw = True
         new_pos = self.make_move()
         if new_pos is None:  # If they've hit the end of their path
             if self in entity_list:
@@ -105,16 +107,28 @@ class Entity:
         self.current_loc = new_pos
         return self.current_loc[0], self.current_loc[1]
 
-    def draw(self, window: pygame.surface.Surface, x_offset: int, y_offset: int, view: str) -> None:
-        if view not in ("general_view", "crazy_view", "colour_view"):
+    def shift(self, x_change: int, y_change: int) -> None:
+        """Moves every coord it knows about, for when the map grows on the left or top and all the tiles move along"""
+        self.start = (self.start[0] + x_change, self.start[1] + y_change)
+        self.end = (self.end[0] + x_change, self.end[1] + y_change)
+        self.current_loc = (self.current_loc[0] + x_change, self.current_loc[1] + y_change)
+        self.path = [(x + x_change, y + y_change) for x, y in self.path]
+
+    def draw(self, compositor: Compositor, camera: Camera, view: str) -> None:
+        if view not in ("general_view", "crazy_view", "colour_view") or camera.is_lod:
             return
-        image = rotated_entities_cache[f"{self.__class__.__name__.lower()}_{self.entity_subtype}_rotation_{self.rotation}"]
+        image = camera.scaled(rotated_entities_cache[f"{self.__class__.__name__.lower()}_{self.entity_subtype}_rotation_{self.rotation}"])
 
-        x_loc = (self.current_loc[0] * TILE_WIDTH) + self.x_offset + x_offset
-        y_loc = (self.current_loc[1] * TILE_WIDTH) + self.y_offset + y_offset
-        if x_loc < 0 or y_loc < 0 or x_loc > window.get_width()-ICON_SIZE or y_loc > window.get_height()-ICON_SIZE:
+        # The offsets inside the tile are in unzoomed pixels
+        x_loc, y_loc = camera.coords_to_screen_pos(*self.current_loc)
+        x_loc += self.x_offset * camera.tile_width // TILE_WIDTH
+        y_loc += self.y_offset * camera.tile_width // TILE_WIDTH
+        if x_loc < 0 or y_loc < 0 or x_loc > compositor.window.get_width()-ICON_SIZE or y_loc > compositor.window.get_height()-ICON_SIZE:
             return  # Don't draw anything off screen
-        window.blit(image, (x_loc, y_loc))
+        if view == "crazy_view":
+            compositor.draw_static(image, (x_loc, y_loc))  # Crazy works by letting entities smear over the map
+        else:
+            compositor.draw_transient(image, (x_loc, y_loc))
 
     def make_move(self) -> None | tuple[int, int]:  # If they're at the end, it'll be None
         if not self.path:  # If they've reached the end
@@ -140,6 +154,8 @@ class Entity:
         if self.entity_subtype == "FireEngine":
             # If a fire truck arrives, remove the fire, and send one home (if it's not already returning)
             map[self.end[0], self.end[1]].fire_ticks = None
+            map[self.end[0], self.end[1]].redraw = True
+            map.mark_changed(*self.end)
             # If they're returning to station, they won't be in the on_route list
             if self in map.emergency_vehicles_on_route["FireStation"]:
                 map.emergency_vehicles_on_route["FireStation"].remove(self)  # type: ignore[arg-type]
@@ -169,16 +185,18 @@ class Vehicle(Entity):
         "DOWN":  (9, 0, 180),
     }
 
-    def __init__(self, *args, **kwargs) -> None:  # type: ignore[no-untyped-def]
+    def __init__(self, entity_subtype: str, map: Map, *args, **kwargs) -> None:  # type: ignore[no-untyped-def]
         """
         Initializes a Vehicle object.
 
         Args:
+            entity_subtype: The route type, or the type of service vehicle.
+            map: The map it's on, its random numbers come from the map's rng.
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
-        super().__init__(*args, **kwargs)
-        self.passengers = [Person() for _ in range(randint(1, 4))]
+        super().__init__(entity_subtype, map, *args, **kwargs)
+        self.passengers = [Person(map.rng) for _ in range(map.rng.randint(1, 4))]
 
     def __repr__(self) -> str:
         """
@@ -197,9 +215,9 @@ class Person:
 
     __slots__ = ("name", "age")
 
-    def __init__(self) -> None:
-        self.name = get_random_name()
-        self.age = randint(18, 65)
+    def __init__(self, rng: Random) -> None:
+        self.name = get_random_name(rng)
+        self.age = rng.randint(18, 65)
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.name=}, {self.age=})"
@@ -1,8 +1,25 @@
 from __future__ import annotations
 
+import argparse
+import io
 import json
-from typing import TypedDict
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Iterator, TextIO, TypedDict
+from uuid import uuid4
 
+import numpy as np
+
+from classes import GenericTile, Tile, get_type_by_name
+from journal import (Journal, journal_path, read_journal_preview,
+                     replay_journal)
 from map_object import Map
 
 BASE_PREFERENCES: PreferencesType = {"max_vehicles": 500, "max_pedestrians": 0, "rainbow_entities": False, "old_roads": False}
@@ -15,14 +32,316 @@ class PreferencesType(TypedDict):
     old_roads: bool
 
 
+# Binary saves are: SAVE_MAGIC, the header length as a little endian uint32, a json header, then each tile array zlib compressed
+# Saves without the magic are the old indented json format, which can still be loaded
+SAVE_MAGIC = b"SIMCITY\x00"
+SAVE_FORMAT_VERSION = 1
+HEADER_LENGTH = struct.Struct("<I")
+COMPRESSION_LEVEL = 6
+
+
+def encode_save(header: dict[str, Any], arrays: dict[str, np.ndarray[Any, Any]]) -> bytes:
+    blobs: list[bytes] = []
+    header = header | {"format": SAVE_FORMAT_VERSION, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        blob = zlib.compress(np.ascontiguousarray(array).tobytes(), COMPRESSION_LEVEL)
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": array.shape, "offset": offset, "size": len(blob)}
+        blobs.append(blob)
+        offset += len(blob)
+    header_bytes = json.dumps(header).encode("utf-8")
+    return b"".join([SAVE_MAGIC, HEADER_LENGTH.pack(len(header_bytes)), header_bytes, *blobs])
+
+
+def decode_header(data: bytes) -> tuple[dict[str, Any], int]:
+    """Returns the header, and where the arrays start, data only needs to be long enough to hold the header"""
+    header_start = len(SAVE_MAGIC) + HEADER_LENGTH.size
+    (header_length,) = HEADER_LENGTH.unpack_from(data, len(SAVE_MAGIC))
+    header = json.loads(data[header_start : header_start + header_length])
+    if header["format"] > SAVE_FORMAT_VERSION:
+        raise ValueError(f"file_manager: save format {header['format']} is newer than this game supports ({SAVE_FORMAT_VERSION})")
+    return header, header_start + header_length
+
+
+def decode_array(blob: bytes, info: dict[str, Any]) -> np.ndarray[Any, Any]:
+    return np.frombuffer(zlib.decompress(blob), dtype=info["dtype"]).reshape(info["shape"])
+
+
+def decode_save(data: bytes) -> tuple[dict[str, Any], dict[str, np.ndarray[Any, Any]]]:
+    header, body_start = decode_header(data)
+    arrays = {}
+    for name, info in header["arrays"].items():
+        arrays[name] = decode_array(data[body_start + info["offset"] : body_start + info["offset"] + info["size"]], info)
+    return header, arrays
+
+
+def write_save_file(save_file_name: str, data: bytes) -> None:
+    """Writes to a temporary file first, then renames it over the save, so a crash mid-write can't corrupt the old save"""
+    temp_path = "saves/" + save_file_name + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, "saves/" + save_file_name)
+
+
 def save_game(map: Map, save_file_name: str) -> None:
-    with open("saves/" + save_file_name, "w", encoding="utf-8") as file:
-        json.dump(map.to_dict(), file, indent=4)
+    """
+    If the map was loaded from or saved to this file already, its journal has every change since, so it only needs flushing.
+    Otherwise, for old json saves, or once the journal gets too long, the whole world is written and a new journal started
+    """
+    journal = map.journal
+    if journal is not None and journal.save_file_name == save_file_name and journal.journal_id is not None and not journal.needs_compacting:
+        journal.flush(map)
+        return
+    header, arrays = map.to_arrays()
+    journal_id = uuid4().hex
+    write_save_file(save_file_name, encode_save(header | {"journal_id": journal_id}, arrays))
+    if journal is not None:
+        journal.close()
+    map.journal = Journal(save_file_name, journal_id, map)
+
+
+# ================================================================================================
+JSON_CHUNK_SIZE = 64 * 1024  # Characters
+JSON_WHITESPACE = re.compile(r"\s*")
+
+
+class JsonStream:
+    """
+    Reads json one value at a time, only keeping a chunk of the file in memory,
+    so old json saves can be loaded a tile at a time instead of as one huge dict
+    """
+
+    def __init__(self, file: TextIO) -> None:
+        self.file = file
+        self.buffer = ""
+        self.position = 0
+        self.at_end = False
+        self.decoder = json.JSONDecoder()
+
+    def read_chunk(self) -> None:
+        chunk = self.file.read(JSON_CHUNK_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk  # Drop everything that's already been read
+        self.position = 0
+        self.at_end = chunk == ""
+
+    def peek(self) -> str:
+        """Skips whitespace, then returns the next character without reading it, or "" at the end of the file"""
+        while True:
+            self.position = JSON_WHITESPACE.match(self.buffer, self.position).end()  # type: ignore[union-attr]
+            if self.position < len(self.buffer) or self.at_end:
+                return self.buffer[self.position : self.position+1]
+            self.read_chunk()
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if character == "" or character not in characters:
+            raise ValueError(f"file_manager: Expected one of {characters!r} in json save, got {character!r}")
+        self.position += 1
+        return character
+
+    def read_value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                if end < len(self.buffer) or self.at_end:  # A number right at the end of the buffer might carry on in the next chunk
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.at_end:
+                    raise
+            self.read_chunk()
+
+    def iter_list(self) -> Iterator[None]:
+        """Yields once per item in a list, the caller has to read each item before the next one"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield
+            if self.expect(",]") == "]":
+                return
+
+
+def load_json_save(file: TextIO) -> Map:
+    """
+    Builds each Tile straight from the file, rather than loading the whole thing into lists of dicts first
+    """
+    stream = JsonStream(file)
+    tile_types: dict[str, GenericTile] = {}
+    columns: list[list[Tile]] = []
+    values: dict[str, Any] = {}
+    stream.expect("{")
+    while True:
+        key = stream.read_value()
+        stream.expect(":")
+        if key == "tiles":
+            for _ in stream.iter_list():
+                column = []
+                for _ in stream.iter_list():
+                    data = stream.read_value()
+                    type_name = data.pop("type")
+                    if type_name not in tile_types:
+                        tile_types[type_name] = get_type_by_name(type_name)
+                    column.append(Tile(tile_types[type_name], **data))
+                columns.append(column)
+        else:
+            values[key] = stream.read_value()
+        if stream.expect(",}") == "}":
+            break
+
+    tiles = np.empty((values["settings"]["map_width"], values["settings"]["map_height"]), dtype=object)
+    for x, column in enumerate(columns):
+        tiles[x, :] = column
+    return Map(tiles, values["cash"], values["version"], values["settings"])
+
+
+def load_game(save_file_name: str, attach_journal: bool = True) -> Map:
+    with open("saves/" + save_file_name, "rb") as file:
+        is_binary = file.read(len(SAVE_MAGIC)) == SAVE_MAGIC
+        if is_binary:  # Mapped rather than read, so only the parts being decompressed are ever in memory
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                header, arrays = decode_save(data)  # type: ignore[arg-type]
+            map, journal_id = Map.from_arrays(header, arrays), header.get("journal_id")
+    if not is_binary:
+        with open("saves/" + save_file_name, "r", encoding="utf-8") as file:
+            map, journal_id = load_json_save(file), None  # Old json save
+    op_count = replay_journal(map, save_file_name, journal_id)
+    if attach_journal:
+        map.journal = Journal(save_file_name, journal_id, map, op_count)
+    return map
+
+
+# ================================================================================================
+class SaveInfoType(TypedDict):
+    size: int  # Bytes
+    modified_time: int  # Nanoseconds
+    journal_modified_time: int | None  # Saving into the journal doesn't touch the save itself
+    metadata: dict[str, Any] | None  # None for old json saves, see Map.snapshot_to_arrays
+    thumbnail: np.ndarray[Any, Any] | None  # (width, height, 3) colours
 
 
-def load_game(save_file_name: str) -> Map:
-    with open("saves/" + save_file_name, "r", encoding="utf-8") as file:
-        return Map.from_dict(json.load(file))
+def get_modified_times(save_file_name: str) -> tuple[int, int | None]:
+    path = journal_path(save_file_name)
+    return os.stat("saves/" + save_file_name).st_mtime_ns, os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def read_save_info(save_file_name: str) -> SaveInfoType:
+    """Only reads the header and thumbnail, never the tiles, the journal's are used instead if it has been saved to since"""
+    path = "saves/" + save_file_name
+    modified_time, journal_modified_time = get_modified_times(save_file_name)
+    info: SaveInfoType = {
+        "size": os.stat(path).st_size, "modified_time": modified_time, "journal_modified_time": journal_modified_time,
+        "metadata": None, "thumbnail": None,
+    }
+    with open(path, "rb") as file:
+        start = file.read(len(SAVE_MAGIC) + HEADER_LENGTH.size)
+        if not start.startswith(SAVE_MAGIC):
+            return info  # Old json save, it would need loading entirely
+        (header_length,) = HEADER_LENGTH.unpack_from(start, len(SAVE_MAGIC))
+        header, body_start = decode_header(start + file.read(header_length))
+        info["metadata"] = header.get("metadata")
+        if "thumbnail" in header["arrays"]:
+            thumbnail_info = header["arrays"]["thumbnail"]
+            file.seek(body_start + thumbnail_info["offset"])
+            info["thumbnail"] = decode_array(file.read(thumbnail_info["size"]), thumbnail_info)
+    journal_preview = read_journal_preview(save_file_name, header.get("journal_id"))
+    if journal_preview is not None:
+        info["metadata"], info["thumbnail"] = journal_preview
+    return info
+
+
+class SaveIndex:
+    """
+    Remembers which saves exist and their info, only listing the folder again when its modified time changes,
+    and only re-reading a save's info when that save's (or its journal's) modified time changes
+    """
+
+    def __init__(self) -> None:
+        self.folder_modified_time: int | None = None
+        self.save_names: list[str] = []
+        self.save_infos: dict[str, SaveInfoType] = {}
+
+    def get_save_names(self) -> list[str]:
+        folder_modified_time = os.stat("saves").st_mtime_ns
+        if folder_modified_time != self.folder_modified_time:
+            self.folder_modified_time = folder_modified_time
+            self.save_names = sorted(file for file in os.listdir("saves") if file.endswith(".simcity"))
+            self.save_infos = {name: info for name, info in self.save_infos.items() if name in self.save_names}
+        return self.save_names
+
+    def get_info(self, save_file_name: str) -> SaveInfoType:
+        info = self.save_infos.get(save_file_name)
+        if info is None or get_modified_times(save_file_name) != (info["modified_time"], info["journal_modified_time"]):
+            info = self.save_infos[save_file_name] = read_save_info(save_file_name)
+        return info
+
+
+SAVE_INDEX = SaveIndex()
+
+# ================================================================================================
+AUTOSAVE_INTERVAL = 120  # Seconds
+AUTOSAVE_SLOTS = 3  # Autosave_1 -> Autosave_3, then back to Autosave_1, so a bad save never replaces every good one
+
+
+class AutoSaver:
+    """
+    Snapshots the map into plain arrays on the main thread (between ticks, so it's never half updated),
+    then compresses and writes it on a background thread so big maps don't make the game stutter
+    """
+
+    def __init__(self) -> None:
+        self.last_save_time = time.monotonic()
+        self.slot = 0
+        self.thread: threading.Thread | None = None
+        self.last_save_name: str | None = None
+        self.snapshot_duration = 0.0  # Seconds spent on the main thread
+        self.write_duration = 0.0  # Seconds spent on the background thread
+        self.error: str | None = None
+
+    @property
+    def is_saving(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def update(self, map: Map) -> None:
+        if time.monotonic() - self.last_save_time >= AUTOSAVE_INTERVAL and not self.is_saving:
+            self.save(map)
+
+    def save(self, map: Map) -> None:
+        start = time.perf_counter()
+        header, snapshot = map.snapshot()  # Fresh tuples, nothing else holds onto them, so the thread can use them safely
+        self.snapshot_duration = time.perf_counter() - start
+        self.last_save_time = time.monotonic()
+
+        self.slot = self.slot % AUTOSAVE_SLOTS + 1
+        save_file_name = f"Autosave_{self.slot}.simcity"
+        self.thread = threading.Thread(target=self.write, args=(save_file_name, header, snapshot), daemon=True)
+        self.thread.start()
+
+    def write(self, save_file_name: str, header: dict[str, Any], snapshot: list[tuple[Any, ...]]) -> None:
+        start = time.perf_counter()
+        try:
+            header, arrays = Map.snapshot_to_arrays(header, snapshot)
+            write_save_file(save_file_name, encode_save(header | {"journal_id": uuid4().hex}, arrays))
+        except Exception as error:  # Anything left uncaught would end the thread silently, and status() would never know
+            self.error = f"{type(error).__name__}: {error}"
+            print(f"file_manager: Autosave to {save_file_name} failed: {self.error}")
+            return
+        self.write_duration = time.perf_counter() - start
+        self.last_save_name, self.error = save_file_name, None
+
+    def status(self) -> str:
+        if self.error is not None:
+            return f"Autosave failed: {self.error}"
+        if self.last_save_name is None:
+            return "No autosave yet"
+        return f"{self.last_save_name}: {self.snapshot_duration*1000:.1f}ms snapshot, {self.write_duration*1000:.1f}ms writing"
+
+
+AUTOSAVER = AutoSaver()
 
 
 def load_preferences() -> PreferencesType:
@@ -35,12 +354,36 @@ def save_preferences(preferences: PreferencesType) -> None:
         json.dump(preferences, file)
 
 
-def migrate_worlds() -> None:
-    import os
+# ================================================================================================
+SAVE_FORMATS = ("binary", "json")
+
 
-    for save in os.listdir("saves"):
-        print(save)
-        map = load_game(save)
+class MigrationResultType(TypedDict):
+    save_file_name: str
+    seconds: float
+    old_size: int
+    new_size: int
+    error: str | None
+
+
+def maps_equal(map: Map, other: Map) -> bool:
+    (header, snapshot), (other_header, other_snapshot) = map.snapshot(), other.snapshot()
+    return (
+        header["cash"] == other_header["cash"] and list(header["version"]) == list(other_header["version"])
+        and header["settings"] == other_header["settings"] and snapshot == other_snapshot
+    )
+
+
+def migrate_save(save_file_name: str, to_format: str = "binary", verify: bool = True) -> MigrationResultType:
+    """
+    Rewrites one save (with its journal applied) in the given format, checking it loads back the same before replacing it.
+    Runs in a worker process, so it reports errors instead of raising them
+    """
+    start = time.perf_counter()
+    result: MigrationResultType = {"save_file_name": save_file_name, "seconds": 0.0, "old_size": 0, "new_size": 0, "error": None}
+    try:
+        result["old_size"] = os.path.getsize("saves/" + save_file_name)
+        map = load_game(save_file_name, attach_journal=False)
 
         # for (_, _, tile) in map.iter():
         # #     #tile.biome = tile.height_map
@@ -48,8 +391,51 @@ def migrate_worlds() -> None:
         #         del tile.road
 
         # map.version = VERSION
-        save_game(map, save)
+        if to_format == "binary":
+            header, arrays = map.to_arrays()
+            data = encode_save(header | {"journal_id": uuid4().hex}, arrays)
+            reloaded = Map.from_arrays(*decode_save(data)) if verify else None
+        else:
+            text = json.dumps(map.to_dict(), indent=4)
+            data = text.encode("utf-8")
+            reloaded = load_json_save(io.StringIO(text)) if verify else None
+
+        if reloaded is not None and not maps_equal(map, reloaded):
+            raise ValueError("the migrated save doesn't load back the same")
+        write_save_file(save_file_name, data)
+        if os.path.exists(journal_path(save_file_name)):
+            os.remove(journal_path(save_file_name))  # It's been written into the save now
+        result["new_size"] = len(data)
+    except Exception as error:  # Any failure just fails this save
+        result["error"] = f"{error.__class__.__name__}: {error}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def migrate_worlds(save_file_names: list[str] | None = None, to_format: str = "binary", workers: int | None = None, verify: bool = True) -> list[MigrationResultType]:
+    """Migrates each save in its own process, since loading and encoding are all CPU bound"""
+    if not save_file_names:
+        save_file_names = sorted(file for file in os.listdir("saves") if file.endswith(".simcity"))
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(migrate_save, save_file_name, to_format, verify) for save_file_name in save_file_names]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = f"FAILED, {result['error']}" if result["error"] else f"{result['old_size'] // 1024} KB -> {result['new_size'] // 1024} KB"
+            print(f"file_manager: {result['save_file_name']:<32} {result['seconds']*1000:>8.1f}ms  {status}")
+    failures = sum(result["error"] is not None for result in results)
+    print(f"file_manager: Migrated {len(results) - failures}/{len(results)} saves to {to_format} in {time.perf_counter() - start:.2f}s")
+    return results
 
 
 if __name__ == "__main__":
-    migrate_worlds()
+    parser = argparse.ArgumentParser(description="Rewrites saves in the given format, run from the game's folder")
+    parser.add_argument("saves", nargs="*", help="Save file names in saves/, defaults to all of them")
+    parser.add_argument("--to", choices=SAVE_FORMATS, default="binary", help="The format to write")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the number of CPUs")
+    parser.add_argument("--no-verify", action="store_true", help="Skip checking each migrated save loads back the same")
+    args = parser.parse_args()
+    results = migrate_worlds(args.saves, args.to, args.workers, verify=not args.no_verify)
+    sys.exit(1 if any(result["error"] for result in results) else 0)
@@ -1,63 +1,94 @@
 import random
 
 import numpy as np
-from perlin_noise import PerlinNoise  # type: ignore[import]
 
-from classes import (Tile, abandoned_tile, entry_road, generate_tile_type,
-                     lily_pad, shrub, tree, weeds)
-from map_object import Map
-from utils import VERSION, MapSettingsType, clip, get_neighbour_coords
+from chunks import (CAN_PLACE_ON, PLANT_IDS, TYPE_IDS, WATER_SMOOTHING_PASSES,
+                    ChunkStore, ChunkType, IntArray, generate_tile_type_ids)
+from classes import TILE_TYPE_NAMES, abandoned_tile, entry_road, water
+from map_object import NULL_VALUE, Map
+from perlin import generate_height_map
+from utils import VERSION, MapSettingsType, smooth_field
 
-FLOORING_TO_PLANT = {
-    "Grass": tree,
-    "Sand": shrub,
-    "Dirt": weeds,
-    "Gravel": weeds,
-    "Water": lily_pad,
-}
+MAX_MAP_SIZE = 256
 
 
-def height_map_calculation(noise: PerlinNoise, x: int, y: int, map_width: int, map_height: int) -> float:
-    return round(clip(noise([x/map_width, y/map_height]) * 3, -1, 1), 2)
+def legacy_randints(count: int, low: int, high: int) -> IntArray:
+    """
+    The same numbers as calling random.randint(low, high) count times, and leaves random in the same state afterwards.
+    Each randint takes the top bits of the next 32 bit word from random's generator, and tries the next word if that's out of range,
+    so we can take a big batch of words at once, keep the ones randint would have, then only move random on by the words actually used
+    """
+    span = high - low + 1
+    shift = 32 - span.bit_length()
+    state = random.getstate()
+    words = np.empty(0, dtype=np.uint32)
+    while True:
+        batch_size = count * 2 + 64  # Over half the words are always in range
+        words = np.concatenate([words, np.frombuffer(random.getrandbits(32 * batch_size).to_bytes(4 * batch_size, "little"), dtype="<u4")])
+        values = words >> shift
+        (in_range,) = np.nonzero(values < span)
+        if len(in_range) >= count:
+            break
+    random.setstate(state)
+    if count:
+        random.getrandbits(32 * (int(in_range[count - 1]) + 1))
+    return values[in_range[:count]].astype(np.int64) + low
 
 
-def generate_world(map_settings: MapSettingsType, seed: int | None = None) -> Map:
+def generate_legacy_world(map_settings: MapSettingsType, seed: int) -> ChunkType:
+    """The type, height_map and water arrays exactly how worlds used to be generated, all in one go with python's random"""
     map_width, map_height = map_settings["map_width"], map_settings["map_height"]
-    world: np.ndarray[tuple[int, int], Tile] = np.array(  # type: ignore[assignment, type-var]
-        [[Tile() for _ in range(map_height)] for _ in range(map_width)]
-    )
-    noise = PerlinNoise(octaves=2, seed=seed or map_settings["seed"])   #  or random.randint(0, 100)
-    random.seed(seed or map_settings["seed"])
-
-    for x in range(map_width):
-        for y in range(map_height):
-            world[x, y].height_map = height_map_calculation(noise, x, y, map_width, map_height) if map_settings["generate_biomes"] else -0.5
-            world[x, y].type = generate_tile_type(world[x, y].height_map, include_water=map_settings["generate_lakes"])
-
-            if random.randint(1, 100) < map_settings["tree_density"]:
-                floor_name = world[x, y].type.name
-                if floor_name in FLOORING_TO_PLANT:
-                    world[x, y].type = FLOORING_TO_PLANT[floor_name]
-
-            # Water map
-            # We generate 10 million on each water tile, knowing it'll be smoothed out+reduced by the next step
-            world[x, y].water = 10_000_000 if world[x, y].type.name == "Water" else 0
+    shape = (map_width, map_height)
+
+    if map_settings["generate_biomes"]:
+        height_map = generate_height_map(map_width, map_height, seed, legacy=True)
+    else:
+        height_map = np.full(shape, -0.5)
+    type_ids = generate_tile_type_ids(height_map, include_water=map_settings["generate_lakes"])
+
+    random.seed(seed)
+    tree_rolls = legacy_randints(map_width * map_height, 1, 100).reshape(shape)  # One roll per tile, in x then y order
+    type_ids = np.where(tree_rolls < map_settings["tree_density"], PLANT_IDS[type_ids], type_ids)
     # ==================================================================
     # Generate water map
-    for _ in range(10):  # 10x smoothing
-        for x in range(map_width):
-            for y in range(map_height):
-                neighbours = get_neighbour_coords(map_width, map_height, x, y)
-                total = sum(world[_x, _y].water for (_x, _y) in neighbours)  # type: ignore[attr-defined] # Won't always have 4 neighbours  
-                world[x, y].water = int(clip(num=total / len(neighbours), minimum=0, maximum=255))
+    # We generate 10 million on each water tile, knowing it'll be smoothed out+reduced by the next step
+    water_map = np.where(type_ids == TYPE_IDS[water.name], 10_000_000, 0)
+    water_map = smooth_field(water_map, passes=WATER_SMOOTHING_PASSES, minimum=0, maximum=255)  # 10x smoothing
     # ==================================================================
     if map_settings["generate_ruins"]:
-        for _ in range((map_width*map_height) // 144):
-            x, y = random.randint(0, map_width - 1), random.randint(0, map_height - 1)
-            if world[x, y].type.can_place_on:
-                world[x, y].type = abandoned_tile
+        ruins = [(random.randint(0, map_width - 1), random.randint(0, map_height - 1)) for _ in range((map_width*map_height) // 144)]
+        ruin_xs, ruin_ys = np.array(ruins, dtype=int).reshape(-1, 2).T
+        ruins_placed = CAN_PLACE_ON[type_ids[ruin_xs, ruin_ys]]
+        type_ids[ruin_xs[ruins_placed], ruin_ys[ruins_placed]] = TYPE_IDS[abandoned_tile.name]
+
+    return {"type": type_ids, "height_map": height_map, "water": water_map}
+
+
+def generate_world(map_settings: MapSettingsType, seed: int | None = None) -> Map:
+    """
+    Builds the whole world as arrays, then makes the tiles from them in one go.
+    Worlds made before legacy_generation existed (or with it set) are generated exactly how they always were, using python's
+    random and perlin_noise's heights, so their seeds still make the same world. Otherwise it's the map's part of the
+    endless world in its chunk store, which expanding the map then carries on into
+    """
+    map_settings = map_settings | {"seed": seed or map_settings["seed"], "world_x": 0, "world_y": 0}
+    map_width, map_height, seed = map_settings["map_width"], map_settings["map_height"], map_settings["seed"]
+    shape = (map_width, map_height)
 
-    world[0, map_height // 2].type = entry_road  # Set the entry road in
+    chunk_store = None
+    if map_settings.get("legacy_generation", True):
+        arrays = generate_legacy_world(map_settings, seed)
+    else:
+        chunk_store = ChunkStore(map_settings, seed)
+        arrays = chunk_store.get_area(0, 0, map_width, map_height)
+    arrays["type"][0, map_height // 2] = TYPE_IDS[entry_road.name]  # Set the entry road in
 
-    map = Map(world, map_settings["starting_cash"], VERSION, map_settings)
+    header = {"cash": map_settings["starting_cash"], "version": VERSION, "settings": map_settings, "type_names": TILE_TYPE_NAMES}
+    no_value = np.full(shape, NULL_VALUE)
+    arrays |= {
+        "biome": np.zeros(shape, dtype=int), "quality": np.zeros(shape, dtype=int), "density": np.zeros(shape, dtype=int),
+        "level": no_value, "happiness": np.full(shape, 5), "fire_ticks": no_value,
+    }
+    map = Map.from_arrays(header, arrays)
+    map.chunk_store = chunk_store or map.chunk_store  # Keep the chunks that were just made
     return map
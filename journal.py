@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import zlib
+from typing import TYPE_CHECKING, Any, TextIO
+
+import numpy as np
+
+from classes import Tile, get_type_by_name
+from map_object import SNAPSHOT_FIELDS_GETTER
+
+if TYPE_CHECKING:
+    from map_object import Map
+
+# A journal is a json list per line, appended to saves/<save name>.journal each time the game is saved:
+# ["base", journal_id]                  - Always first, the journal only applies to the save with the same journal_id
+# ["tile", x, y, type_name, *fields]    - The tile's state at the time, so replaying one twice is harmless
+# ["expand", direction]
+# ["cash", cash]
+# ["settings", settings]
+# ["preview", metadata, shape, thumbnail]   - Written every save for the load menu, the thumbnail's colours are zlib compressed in base64
+JOURNAL_COMPACT_OPS = 5_000  # Once a journal has more ops than this, the next save rewrites the whole world instead
+
+
+def journal_path(save_file_name: str) -> str:
+    return "saves/" + save_file_name + ".journal"
+
+
+class Journal:
+    """
+    Records every change to a saved map, so saving only has to append what changed since the last save. Nothing is written
+    until then, so quitting without saving still throws the changes away (the autosaves are there for crashes)
+    """
+
+    def __init__(self, save_file_name: str, journal_id: str | None, map: Map, op_count: int = 0) -> None:
+        self.save_file_name = save_file_name
+        self.journal_id = journal_id
+        self.op_count = op_count
+        self.changed_tiles: set[tuple[int, int]] = set()
+        self.pending: list[list[Any]] = []  # Ops waiting for the next save
+        self.last_cash = map.cash
+        self.last_settings = dict(map.settings)
+        self.file: TextIO | None = None  # Only created once there's something to write
+        if op_count == 0 and os.path.exists(journal_path(save_file_name)):
+            os.remove(journal_path(save_file_name))  # It belongs to an older version of the save
+
+    def __repr__(self) -> str:
+        return f"Journal({self.save_file_name=}, {self.op_count=})"
+
+    @property
+    def needs_compacting(self) -> bool:
+        return self.op_count + len(self.pending) > JOURNAL_COMPACT_OPS
+
+    def write(self, op: list[Any]) -> None:
+        if self.file is None:
+            self.file = open(journal_path(self.save_file_name), "a", encoding="utf-8")
+            if self.op_count == 0:
+                self.file.write(json.dumps(["base", self.journal_id]) + "\n")
+                self.op_count += 1
+        self.file.write(json.dumps(op) + "\n")
+        self.op_count += 1
+
+    def record_expand(self, map: Map, direction: str) -> None:
+        """Has to be called before expanding, so tiles changed before it are recorded with their old coords"""
+        self.collect(map)
+        self.pending.append(["expand", direction])
+
+    def collect(self, map: Map) -> None:
+        """Turns everything that's changed so far into pending ops"""
+        for x, y in sorted(self.changed_tiles):
+            if 0 <= x < map.width and 0 <= y < map.height:
+                tile_type, *fields = SNAPSHOT_FIELDS_GETTER(map[x, y])
+                self.pending.append(["tile", x, y, tile_type.name, *fields])
+        self.changed_tiles.clear()
+
+        if map.cash != self.last_cash:
+            self.last_cash = map.cash
+            self.pending.append(["cash", map.cash])
+        if map.settings != self.last_settings:
+            self.last_settings = dict(map.settings)
+            self.pending.append(["settings", dict(map.settings)])  # A copy, expand changes the settings in place
+
+    def flush(self, map: Map) -> None:
+        """Writes every change since the last save, only saving the game should call this"""
+        self.collect(map)
+        metadata, thumbnail = map.preview()
+        self.pending.append(["preview", metadata, list(thumbnail.shape), base64.b64encode(zlib.compress(thumbnail.tobytes())).decode("ascii")])
+        for op in self.pending:
+            self.write(op)
+        self.pending.clear()
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())  # The save isn't done until it's on disk, like write_save_file
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+def read_journal_preview(save_file_name: str, journal_id: str | None) -> tuple[dict[str, Any], np.ndarray[Any, Any]] | None:
+    """The metadata and thumbnail from the last save written to the journal, if it belongs to this version of the save"""
+    if not os.path.exists(journal_path(save_file_name)):
+        return None
+    with open(journal_path(save_file_name), "r", encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    if not lines or json.loads(lines[0]) != ["base", journal_id]:
+        return None
+    for line in reversed(lines):
+        if line.startswith('["preview"'):
+            try:
+                _, metadata, shape, thumbnail = json.loads(line)
+            except json.JSONDecodeError:  # Half written
+                continue
+            return metadata, np.frombuffer(zlib.decompress(base64.b64decode(thumbnail)), dtype="u1").reshape(shape)
+    return None
+
+
+def replay_journal(map: Map, save_file_name: str, journal_id: str | None) -> int:
+    """
+    Applies a save's journal to its freshly loaded map, returns how many ops were applied,
+    or 0 if the journal is missing or belongs to an older version of the save
+    """
+    if not os.path.exists(journal_path(save_file_name)):
+        return 0
+    with open(journal_path(save_file_name), "r", encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    if not lines or json.loads(lines[0]) != ["base", journal_id]:
+        print(f"journal: Ignoring journal for {save_file_name}, it doesn't match the save")
+        return 0
+
+    op_count = 1
+    for line in lines[1:]:
+        try:
+            op_name, *args = json.loads(line)
+        except json.JSONDecodeError:  # A half written line from a crash, everything before it is fine
+            print(f"journal: Stopped replaying {save_file_name} at a broken line")
+            with open(journal_path(save_file_name), "w", encoding="utf-8") as file:
+                file.write("".join(line + "\n" for line in lines[:op_count]))  # So new ops don't get appended after it
+            break
+        if op_name == "tile":
+            x, y, type_name, biome, height_map, quality, water, density, level, happiness, fire_ticks = args
+            map[x, y] = Tile(get_type_by_name(type_name), biome, height_map, quality, water, density, level, happiness, None, fire_ticks)
+        elif op_name == "expand":
+            map.expand(args[0])
+        elif op_name == "cash":
+            map.cash = args[0]
+        elif op_name == "settings":
+            map.settings = args[0]
+        op_count += 1
+    return op_count
@@ -1,22 +1,24 @@
 import sys  # For sys.exit()
-from random import choice, randint  # For random ticks (and picking traffic)
-from typing import Literal
+from random import randint  # For picking new seeds
 
 import pygame
 
-from classes import get_type_by_name
-from entities import Pedestrian, Vehicle
-from file_manager import load_preferences
+from camera import PAN_SPEED, Camera
+from file_manager import AUTOSAVER, load_preferences
 from generate_world import generate_world
 from menu import dev_screen, draw_main_menu, draw_pause_menu
 from menu_elements import FadingTextBottomButton, handle_collisions
-from overlays import generate_bottom_bar, generate_side_bar
+from metrics import METRICS
+from overlays import (draw_profiler_overlay, generate_bottom_bar,
+                      generate_side_bar)
+from profiler import PROFILER
+from renderer import DIRTY_RECTS, Compositor
+from replay import apply_action, start_recording, stop_recording
+from simulation import GAME_SPEEDS, Simulation
 # ============================
-from utils import (DESIRED_FPS, IMAGES, TICK_RATE, TILE_EXPANSION_COST,
-                   TILE_WIDTH, VERSION, MapSettingsType,
-                   convert_mouse_pos_to_coords, coords_to_screen_pos,
-                   generate_background_image, get_all_grid_coords,
-                   get_class_properties)
+from utils import (DESIRED_FPS, IMAGES, TILE_EXPANSION_COST, VERSION,
+                   MapSettingsType, generate_background_image,
+                   get_all_grid_coords, get_class_properties)
 
 # https://www.freepik.com/search?format=search&query=fire%20station%20icon%20pixel%20art
 print("main: Starting")
@@ -27,22 +29,21 @@ window = pygame.display.set_mode((1710, 870), pygame.RESIZABLE)  # | pygame.DOUB
 window.set_alpha(None)  # This is for performance
 pygame.display.set_caption(f"Sim City {'.'.join([str(x) for x in VERSION])}")
 pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN,
-                          pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION, pygame.VIDEORESIZE])
+                          pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION, pygame.MOUSEWHEEL, pygame.VIDEORESIZE])
 # ============================
 # Vars init
-run_counter = 0
 icon_offset = 0
 view_index = 0
-ENTITIES_TO_CREATE_PER_TICK = 2
 movement_keys = [pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d]
+speed_keys = [pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4]  # One for each of GAME_SPEEDS
 
 mouse_down_x, mouse_down_y = None, None
 mouse_down_tile_x, mouse_down_tile_y = None, None
 mouse_motion_x, mouse_motion_y = None, None
 mouse_motion_tile_x, mouse_motion_tile_y = None, None
 
-pause = False
 dev_mode = False
+show_profiler = False
 
 tool = "select"
 draw_style = "single"
@@ -66,7 +67,10 @@ view = views[0]
 # ============================
 map = draw_main_menu(window)
 preferences = load_preferences()
-x_offset, y_offset, expansion_rectangles = map.reset_map(window)
+simulation = Simulation(map, preferences)
+compositor = Compositor(window)
+camera = Camera()
+expansion_rectangles = map.reset_map(compositor, camera)
 fading_text_element = FadingTextBottomButton(0, 0, 16, 16, [])
 side_bar_elements = []  # type: ignore[var-annotated]
 # vignette_values = generate_vignette_overlay(window)
@@ -74,21 +78,14 @@ side_bar_elements = []  # type: ignore[var-annotated]
 clock = pygame.time.Clock()
 
 while True:
-    if run_counter % (DESIRED_FPS*3) == 0:  # Once a second
-        map.check_connected()  # Update any roads that are not connected to the main road network, and also check any buildings not on roads
-
+    PROFILER.switch("input")
     held_keys = pygame.key.get_pressed()
     if any(held_keys[x] for x in movement_keys):
         held_key = movement_keys[[held_keys[x] for x in movement_keys].index(True)]
-        offsets = {"w": (0, TILE_WIDTH), "s": (0, -TILE_WIDTH), "a": (TILE_WIDTH, 0), "d": (-TILE_WIDTH, 0)}
-        new_x_offset, new_y_offset = offsets[pygame.key.name(held_key)][0], offsets[pygame.key.name(held_key)][1]
-        # Only move the offset if the new position is within the map
-        if -map.width  * TILE_WIDTH <= x_offset + new_x_offset <= window.get_width():
-            x_offset += new_x_offset
-        if -map.height * TILE_WIDTH <= y_offset + new_y_offset <= window.get_height():
-            y_offset += new_y_offset
-        
-        window.blit(map.background_image, (0, 0))
+        offsets = {"w": (0, PAN_SPEED), "s": (0, -PAN_SPEED), "a": (PAN_SPEED, 0), "d": (-PAN_SPEED, 0)}
+        camera.pan(*offsets[pygame.key.name(held_key)], map, window)
+
+        compositor.reset(map.background_image, expansion_rectangles, camera, map)
         map.redraw_entire_map()
 
         mouse_down_x, mouse_down_y = None, None
@@ -99,64 +96,98 @@ while True:
     # CONTROLS
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
+            stop_recording(map, simulation)
             pygame.quit()
             sys.exit()
         # ----------------------------------------------------------
         if event.type == pygame.VIDEORESIZE:
             map.background_image = generate_background_image(window)
-            window.blit(map.background_image, (0, 0))
-            x_offset, y_offset, expansion_rectangles = map.reset_map(window)
+            expansion_rectangles = map.reset_map(compositor, camera)
         # ----------------------------------------------------------
         # KEY DOWN
         elif event.type == pygame.KEYDOWN:  # If they press a key
             if event.key == pygame.K_q:  # Re-center map
-                x_offset, y_offset, expansion_rectangles = map.reset_map(window)
+                expansion_rectangles = map.reset_map(compositor, camera)
 
             elif event.key in [pygame.K_COMMA, pygame.K_PERIOD]:
                 view_index += 1 if event.key == pygame.K_PERIOD else -1
                 view = views[view_index % len(views)]
                 map.redraw_entire_map()
 
+            elif event.key in [pygame.K_EQUALS, pygame.K_MINUS]:
+                if camera.zoom(1 if event.key == pygame.K_EQUALS else -1, *pygame.mouse.get_pos()):
+                    expansion_rectangles = map.reset_map(compositor, camera, recenter=False)
+
             elif event.key == pygame.K_p:
-                pause = not pause
+                apply_action(map, simulation, "pause")
+
+            elif event.key in speed_keys:
+                simulation.speed = GAME_SPEEDS[speed_keys.index(event.key)]
+                fading_text_element.add_to_queue(f"Game speed: {simulation.speed_name}")
 
             elif event.key == pygame.K_f:
                 if dev_mode:
                     assert mouse_motion_tile_x is not None and mouse_motion_tile_y is not None
-                    map[mouse_motion_tile_x, mouse_motion_tile_y].fire_ticks = 1
+                    apply_action(map, simulation, "fire", mouse_motion_tile_x, mouse_motion_tile_y)
+
+            elif event.key == pygame.K_o:  # Start or stop recording a replay
+                replay_name = stop_recording(map, simulation)
+                if replay_name is None:
+                    map = start_recording(map, simulation)
+                    expansion_rectangles = map.reset_map(compositor, camera, recenter=False)
+                fading_text_element.add_to_queue("Recording replay" if replay_name is None else f"Saved replay {replay_name}")
+
+            elif event.key == pygame.K_g:  # Frame time graph
+                show_profiler = not show_profiler
 
             elif event.key == pygame.K_v:
+                cash = map.cash
                 dev_mode = dev_screen(window, map, dev_mode)
-                _, _, expansion_rectangles = map.reset_map(window)
+                if map.cash != cash:  # Given money, the map records expanding itself
+                    new_cash, map.cash = map.cash, cash
+                    apply_action(map, simulation, "cash", new_cash)
+                expansion_rectangles = map.reset_map(compositor, camera, recenter=False)
 
             elif event.key == pygame.K_e:
                 map.expand()
-                x_offset, y_offset, expansion_rectangles = map.reset_map(window)
+                expansion_rectangles = map.reset_map(compositor, camera, clear_entities=False)
 
             elif event.key == pygame.K_r:
+                stop_recording(map, simulation)
                 map = generate_world(map_settings=map.settings, seed=randint(1, 100))  # pyright: ignore
+                simulation.map = map
 
             elif event.key == pygame.K_ESCAPE:
                 result = draw_pause_menu(window, map)
                 if result is not None:
+                    stop_recording(map, simulation)
                     map = result
-                preferences = load_preferences()
-                x_offset, y_offset, expansion_rectangles = map.reset_map(window)
+                simulation.map = map
+                if load_preferences() != preferences:
+                    preferences = load_preferences()
+                    apply_action(map, simulation, "preferences", preferences)
+                expansion_rectangles = map.reset_map(compositor, camera)
 
                 mouse_down_x, mouse_down_y = None, None  # TODO: Change how this works I guess
                 mouse_down_tile_x, mouse_down_tile_y = None, None
                 mouse_motion_x, mouse_motion_y = None, None
                 mouse_motion_tile_x, mouse_motion_tile_y = None, None
         # ----------------------------------------------------------
+        # MOUSE WHEEL
+        elif event.type == pygame.MOUSEWHEEL and event.y != 0:
+            if camera.zoom(1 if event.y > 0 else -1, *pygame.mouse.get_pos()):
+                expansion_rectangles = map.reset_map(compositor, camera, recenter=False)
+        # ----------------------------------------------------------
         # MOUSE DOWN
         elif event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_LEFT:  # When they click the button
             mouse_down_x, mouse_down_y = pygame.mouse.get_pos()
-            mouse_down_tile_x, mouse_down_tile_y = convert_mouse_pos_to_coords(mouse_down_x, mouse_down_y, x_offset, y_offset, map, window)
+            mouse_down_tile_x, mouse_down_tile_y = camera.screen_pos_to_coords(mouse_down_x, mouse_down_y, map, window)
 
             right_bar_result: None | tuple[str, str, int, MapSettingsType] = handle_collisions(window, mouse_down_x, mouse_down_y, side_bar_elements, 0, 0)
             if right_bar_result is not None:
                 tool, draw_style, icon_offset, new_settings = right_bar_result
-                map.settings: MapSettingsType = map.settings | new_settings  # type: ignore[misc]
+                apply_action(map, simulation, "settings", new_settings)
+                compositor.restore(window.get_rect())  # The policy screen draws over everything
                 map.redraw_entire_map()
 
             vehicles = [x for x in map.entity_lists["Vehicle"] if x.current_loc == (mouse_down_tile_x, mouse_down_tile_y)]
@@ -164,42 +195,34 @@ while True:
                 fading_text_element.add_to_queue(str(vehicles[0]))
 
             for rectangle in expansion_rectangles:
-                if rectangle.intersected(mouse_down_x-x_offset, mouse_down_y-y_offset):
-                    expansion_cost = (rectangle.width // TILE_WIDTH) * (rectangle.height // TILE_WIDTH) * TILE_EXPANSION_COST
+                if rectangle.intersected(mouse_down_x-camera.x_offset, mouse_down_y-camera.y_offset):
+                    expansion_cost = (map.height if rectangle.text in ["left", "right"] else map.width) * TILE_EXPANSION_COST
                     if expansion_cost > map.cash:
                         fading_text_element.add_to_queue("Not enough cash")
                     else:
                         fading_text_element.add_to_queue(f"Expanding in direction: {rectangle.text}")
                         map.expand(direction=str(rectangle.text))
-                        x_offset -= TILE_WIDTH if rectangle.text == "left" else 0
-                        y_offset -= TILE_WIDTH if rectangle.text == "top" else 0
-                        map.cash -= expansion_cost
-                        _, _, expansion_rectangles = map.reset_map(window)  # Generate new rectangles
+                        camera.x_offset -= camera.tile_width if rectangle.text == "left" else 0
+                        camera.y_offset -= camera.tile_width if rectangle.text == "top" else 0
+                        apply_action(map, simulation, "cash", map.cash - expansion_cost)
+                        expansion_rectangles = map.reset_map(compositor, camera, recenter=False, clear_entities=False)  # Generate new rectangles
 
         # ----------------------------------------------------------
         # MOUSE UP
         elif event.type == pygame.MOUSEBUTTONUP and event.button == pygame.BUTTON_LEFT:  # When they release the mouse button
             mouse_up_x, mouse_up_y = pygame.mouse.get_pos()
-            mouse_up_tile_x, mouse_up_tile_y = convert_mouse_pos_to_coords(mouse_up_x, mouse_up_y, x_offset, y_offset, map, window)
+            mouse_up_tile_x, mouse_up_tile_y = camera.screen_pos_to_coords(mouse_up_x, mouse_up_y, map, window)
 
             if mouse_up_tile_x is not None and mouse_up_tile_y is not None and mouse_down_tile_x is not None and mouse_down_tile_y is not None:
-                for x, y in get_all_grid_coords(mouse_down_tile_x, mouse_down_tile_y, mouse_up_tile_x, mouse_up_tile_y, single_place=draw_style == "single"):
-                    if tool == "select":
-                        map[x, y].type.on_random_tick(map, x, y)
+                coords = [[x, y] for x, y in get_all_grid_coords(mouse_down_tile_x, mouse_down_tile_y, mouse_up_tile_x, mouse_up_tile_y, single_place=draw_style == "single")]
+                for message in apply_action(map, simulation, "tool", tool, coords):
+                    fading_text_element.add_to_queue(message)
+                if tool == "select":
+                    for x, y in coords:
                         print(f"main: Tile at {x}, {y}: ---------------")
                         for prop in get_class_properties(map[x, y]):
                             print(f"main: {prop}: " + str(getattr(map[x, y], prop)))
-                    elif tool == "destroy":
-                        message = map[x, y].type.on_destroy(map, x, y)
-                        fading_text_element.add_to_queue(message)
-                    else:
-                        tile_class = get_type_by_name(tool)
-                        message = tile_class.on_place(map, x, y)
-                        fading_text_element.add_to_queue(message)
-                    # -----------------------------------
-                    map[x, y].error_list = []
 
-                map.check_connected()
                 map.redraw_entire_map()  # Mainly for roads
 
         elif event.type == pygame.MOUSEBUTTONUP:  # Cancel dragging
@@ -208,84 +231,64 @@ while True:
         # MOUSE MOTION
         elif event.type == pygame.MOUSEMOTION:  # This is for writing the error (when the user moves the mouse over an error square)
             mouse_motion_x, mouse_motion_y = pygame.mouse.get_pos()
-            mouse_motion_tile_x, mouse_motion_tile_y = convert_mouse_pos_to_coords(mouse_motion_x, mouse_motion_y, x_offset, y_offset, map, window)
+            mouse_motion_tile_x, mouse_motion_tile_y = camera.screen_pos_to_coords(mouse_motion_x, mouse_motion_y, map, window)
 
             for rectangle in expansion_rectangles:
-                if rectangle.intersected(mouse_motion_x-x_offset, mouse_motion_y-y_offset):
+                was_hovered = rectangle.is_hovered
+                if rectangle.intersected(mouse_motion_x-camera.x_offset, mouse_motion_y-camera.y_offset):
                     rectangle.on_hover()
                 else:
                     rectangle.off_hover()
+                if rectangle.is_hovered != was_hovered:
+                    rectangle.draw(compositor.terrain, camera.x_offset, camera.y_offset)
+                    compositor.restore(pygame.Rect(rectangle.x1+camera.x_offset, rectangle.y1+camera.y_offset, rectangle.width, rectangle.height))
 
     # =========================================================
-    # ENTITY HANDLING HANDLING
-    for entity_type in [Vehicle, Pedestrian]:
-        entity_name: Literal["Vehicle", "Pedestrian"] = entity_type.__name__  # type: ignore[assignment]
-        entity_list: list[Vehicle] | list[Pedestrian] = map.entity_lists[entity_name]
-        # DRAW
-        for entity in entity_list:
-            entity.draw(window, x_offset, y_offset, view)
-
-        if pause:  # If the game is paused, don't move or create entities
-            continue
-
-        # MOVE
-        if run_counter % entity_type.speed == 0:  # type: ignore[attr-defined]
-            for entity in entity_list:
-                new_pos = entity.update(map, entity_list)  # type: ignore[arg-type]
-                if new_pos is None:
-                    entity.on_arrive(map)
-                else:
-                    map[new_pos].vehicle_heatmap = min(map[new_pos].vehicle_heatmap + 2 * DESIRED_FPS, 255)  # Heatmap
-
-        # CREATE
-        for _ in range(ENTITIES_TO_CREATE_PER_TICK):
-            if len(entity_list) < preferences["max_" + ("vehicles" if entity_name == "Vehicle" else "pedestrians")]:  # type: ignore[literal-required]
-                route_type = choice(["residential", "commercial", "industrial"])
-                entity_type.try_create(entity_type, map, route_type, rainbow_entities_enabled=preferences["rainbow_entities"])  # type: ignore[attr-defined]
+    # SIMULATION
+    # Runs at a fixed rate (times the game speed) however long the last frame took, then only the latest finished tick gets drawn
+    PROFILER.switch("simulation")
+    simulation.advance(clock.get_time() / 1000, redraw_heatmap=view == "heatmap_view")
     # =========================================================
     # DRAWING - MAP
+    PROFILER.switch("map_draw")
+    compositor.begin_frame()  # Wipe last frame's entities and drag squares
+    tiles_redrawn = 0
     for (x, y, tile) in map.iter():
         if tile.redraw:
-            tile.type.draw(window, map, x, y, view, old_roads=preferences["old_roads"], x_offset=x_offset, y_offset=y_offset)
-
-        if run_counter % 4 and tile.vehicle_heatmap > 0:  # Only update the heatmap every 4 ticks so it doesn't decrease too quickly.
-            tile.vehicle_heatmap -= 1
-            if view == "heatmap_view":
-                tile.redraw = True
-
-        if tile.fire_ticks is not None:
-            # tile.redraw = True  # TODO: Remove this
-            tile.fire_ticks += 1
+            tile.type.draw(compositor, camera, map, x, y, view, old_roads=preferences["old_roads"])
+            tiles_redrawn += 1
+    METRICS.observe("tiles_redrawn", tiles_redrawn)
+    compositor.draw_lod(camera, map)  # Only does anything when zoomed far out
+    # ---------------------------------------------------------
+    # DRAWING - Entities
+    PROFILER.switch("entity_draw")
+    for entity_list in (map.entity_lists["Vehicle"], map.entity_lists["Pedestrian"]):
+        for entity in entity_list:
+            entity.draw(compositor, camera, view)
     # ---------------------------------------------------------
     # DRAWING - Drag Grid
+    PROFILER.switch("overlays")
     if mouse_motion_tile_x is not None and mouse_motion_tile_y is not None:
         # GENERATE DRAG GRID
         if pygame.mouse.get_pressed()[0] and mouse_down_tile_x is not None and mouse_down_tile_y is not None:
             for x, y in get_all_grid_coords(mouse_down_tile_x, mouse_down_tile_y, mouse_motion_tile_x, mouse_motion_tile_y, single_place=draw_style == "single"):
-                window.blit(IMAGES["dragged_square"], coords_to_screen_pos(x, y, x_offset, y_offset))
-                map[x, y].redraw = True  # So when we stop dragging or move the drag it will redraw the tile
+                compositor.draw_transient(camera.scaled(IMAGES["dragged_square"]), camera.coords_to_screen_pos(x, y))
 
-        window.blit(IMAGES["dragged_square"], coords_to_screen_pos(mouse_motion_tile_x, mouse_motion_tile_y, x_offset, y_offset))
-        map[mouse_motion_tile_x, mouse_motion_tile_y].redraw = True  # So it gets overriden when we move the mouse again
+        compositor.draw_transient(camera.scaled(IMAGES["dragged_square"]), camera.coords_to_screen_pos(mouse_motion_tile_x, mouse_motion_tile_y))
         # ---------------------------------------------------------
         if tool == "select" and len(map[mouse_motion_tile_x, mouse_motion_tile_y].error_list) > 0:
             fading_text_element.add_to_queue(map[mouse_motion_tile_x, mouse_motion_tile_y].error_list[0])
-
-    # DRAWING Expansion Rectangles
-    for rectangle in expansion_rectangles:
-        rectangle.draw(window, x_offset, y_offset)
+    if show_profiler:
+        draw_profiler_overlay(compositor, PROFILER)
 
     # DRAWING - Side bar
+    PROFILER.switch("ui")
     side_bar_elements = generate_side_bar(tool, draw_style, icon_offset, window, map.settings)
     # Drawing - Bottom bar
-    generate_bottom_bar(window, map, view, run_counter, clock, mouse_motion_tile_x, mouse_motion_tile_y, mouse_motion_x, mouse_motion_y, fading_text_element)
-
-    if not pause:
-        run_counter += 1
+    generate_bottom_bar(window, map, view, simulation, clock, mouse_motion_tile_x, mouse_motion_tile_y, mouse_motion_x, mouse_motion_y, fading_text_element)
 
-    for i in range(TICK_RATE):
-        x, y = randint(0, map.width-1), randint(0, map.height-1)  # randint excludes the last number, so we need to do -1
-        map[x, y].type.on_random_tick(map, x, y)
+    PROFILER.switch("saving")
+    AUTOSAVER.update(map)  # Only saves every so often, after this frame's ticks are done
 
     # Loop over the x and y of the 2d numpy array vignette_values and draw the vignette
     # for x in range(len(vignette_values)):
@@ -294,6 +297,8 @@ while True:
     #         if vignette_values[x, y] != 0:
     #             window.blit(IMAGES["vignette"], (x, y))
 
-    pygame.display.update()
+    PROFILER.switch("display_update")
+    DIRTY_RECTS.update_display(window)
+    PROFILER.end_frame()  # Waiting for the next frame isn't part of it
 
     clock.tick(DESIRED_FPS)
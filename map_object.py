@@ -1,24 +1,32 @@
+import random
 import sys
-from random import choice
+import time
+from operator import attrgetter
 from typing import TYPE_CHECKING, Any, Generator, Literal
 
 import numpy as np
-import pygame
 from pathfinding.core.grid import Grid  # type: ignore[import]
 from pathfinding.finder.best_first import BestFirst  # type: ignore[import]
 
-from classes import ROADS, Tile, entry_road, generate_tile_type
-from expansion import (DIRECTION_TO_COORDS, DIRECTION_TO_SHIFT,
+from chunks import ChunkStore
+from classes import (ALL_TILES, ROADS, TILE_TYPE_NAMES, ZONED_BUILDINGS,
+                     Tile, entry_road, generate_tile_type, get_type_by_name)
+from expansion import (DIRECTION_TO_EDGE, EXPANSION_CAPACITY,
                        generate_expansion_rectangles)
-from utils import (TILE_WIDTH, MapSettingsType, generate_background_image,
+from metrics import METRICS
+from utils import (MapSettingsType, generate_background_image,
                    get_neighbour_coords)
 
 sys.setrecursionlimit(1500)  # 1200 used to be the limit, now it's not
 
 
 if TYPE_CHECKING:
+    from camera import Camera
     from entities import EntityList, Vehicle
+    from journal import Journal
     from menu_elements import HighlightableRectangle
+    from renderer import Compositor
+    from replay import Recorder
 
 # map.road:
 # 0 = Not a read
@@ -32,9 +40,28 @@ COORD_TYPE = tuple[int, int]
 
 finder = BestFirst()
 
+# Tile fields that get stored as one typed array each in binary saves, None is stored as NULL_VALUE
+TILE_ARRAY_DTYPES = {
+    "biome": "<i4",
+    "height_map": "<f8",
+    "quality": "<i4",
+    "water": "<i4",
+    "density": "<i4",
+    "level": "<i4",
+    "happiness": "<i4",
+    "fire_ticks": "<i4",
+}
+NULLABLE_TILE_FIELDS = ("level", "happiness", "fire_ticks")
+NULL_VALUE = -(2**31)
+SNAPSHOT_FIELDS_GETTER = attrgetter("type", *TILE_ARRAY_DTYPES)
+THUMBNAIL_SIZE = 48  # Biggest side of the preview image saved with each world, in tiles
+
 
 class Map:
     def __init__(self, tiles: np.ndarray[tuple[int, int], Tile], cash: int, version: tuple[int, int, int], settings: MapSettingsType) -> None:  # type: ignore[type-var]
+        # tiles is a view into storage, which has spare room around it to expand into, starting at origin
+        self.storage = tiles
+        self.origin = (0, 0)
         self.tiles = tiles
         self.cash = cash
         self.version = version
@@ -53,6 +80,12 @@ class Map:
         }
         # self.route_cache: dict[tuple[COORD_TYPE, COORD_TYPE], list[COORD_TYPE]] = {}
         # The route cache maps start and end coords to their routes
+        self.journal: Journal | None = None  # Only set once the map has been saved or loaded
+        self.recorder: Recorder | None = None  # Only set while the player's actions are being recorded for a replay
+        # Everything random that happens in the simulation comes from here, so the same seed and actions always play out the same
+        self.rng = random.Random(settings.get("seed"))
+        # Where new tiles come from when expanding, legacy worlds don't have any terrain past their edges
+        self.chunk_store = None if settings.get("legacy_generation", True) else ChunkStore(settings, settings["seed"])
 
     @property
     def width(self) -> int:
@@ -83,6 +116,79 @@ class Map:
         map.redraw_entire_map()
         return map
 
+    def snapshot(self) -> tuple[dict[str, Any], list[tuple[Any, ...]]]:
+        """
+        Copies out every tile's saved fields as plain tuples, which is as little work as possible,
+        so it can be done between ticks and the slower array building done elsewhere
+        """
+        header = {"cash": self.cash, "version": self.version, "settings": dict(self.settings)}
+        tiles: list[Tile] = self.tiles.ravel().tolist()
+        return header, [SNAPSHOT_FIELDS_GETTER(tile) for tile in tiles]
+
+    @staticmethod
+    def snapshot_to_arrays(header: dict[str, Any], snapshot: list[tuple[Any, ...]]) -> tuple[dict[str, Any], dict[str, np.ndarray[Any, Any]]]:
+        """
+        Returns a small header, plus each tile field as its own (width, height) array, tile types are
+        stored as ids into the header's type_names, so saving doesn't need a dict per tile.
+        The header's metadata and the thumbnail array are for the load menu, so it doesn't need to load any tiles
+        """
+        shape = (header["settings"]["map_width"], header["settings"]["map_height"])
+        type_names = list(TILE_TYPE_NAMES)
+        type_ids = {tile_type: type_names.index(tile_type.name) for tile_type in ALL_TILES}
+        tile_types, *columns = zip(*snapshot)
+        arrays = {"type": np.array([type_ids[tile_type] for tile_type in tile_types], dtype="u1").reshape(shape)}
+        for (field, dtype), values in zip(TILE_ARRAY_DTYPES.items(), columns):
+            if field in NULLABLE_TILE_FIELDS:
+                values = tuple(NULL_VALUE if value is None else value for value in values)
+            arrays[field] = np.array(values, dtype=dtype).reshape(shape)
+
+        metadata, arrays["thumbnail"] = Map.preview_from_types(header, arrays["type"])
+        return header | {"type_names": type_names, "metadata": metadata}, arrays
+
+    @staticmethod
+    def preview_from_types(header: dict[str, Any], types: np.ndarray[Any, Any]) -> tuple[dict[str, Any], np.ndarray[Any, Any]]:
+        """The load menu's metadata and thumbnail, from a (width, height) array of ids into TILE_TYPE_NAMES"""
+        type_names = list(TILE_TYPE_NAMES)
+        type_counts = np.bincount(types.ravel(), minlength=len(type_names))
+        metadata = {
+            "width": types.shape[0],
+            "height": types.shape[1],
+            "cash": header["cash"],
+            "version": header["version"],
+            "buildings": {name: int(type_counts[type_names.index(name)]) for name in ZONED_BUILDINGS},
+        }
+        palette = np.array([get_type_by_name(name).base_colour for name in type_names], dtype="u1")
+        step = -(-max(types.shape) // THUMBNAIL_SIZE)  # Rounded up, so the thumbnail is never bigger than THUMBNAIL_SIZE
+        return metadata, palette[types[::step, ::step]]
+
+    def preview(self) -> tuple[dict[str, Any], np.ndarray[Any, Any]]:
+        """Same as the metadata and thumbnail in to_arrays, but only looks at each tile's type"""
+        type_names = list(TILE_TYPE_NAMES)
+        type_ids = {tile_type: type_names.index(tile_type.name) for tile_type in ALL_TILES}
+        tiles: list[Tile] = self.tiles.ravel().tolist()
+        types = np.array([type_ids[tile.type] for tile in tiles], dtype="u1").reshape(self.width, self.height)
+        return self.preview_from_types({"cash": self.cash, "version": self.version}, types)
+
+    def to_arrays(self) -> tuple[dict[str, Any], dict[str, np.ndarray[Any, Any]]]:
+        return self.snapshot_to_arrays(*self.snapshot())
+
+    @classmethod
+    def from_arrays(cls, header: dict[str, Any], arrays: dict[str, np.ndarray[Any, Any]]) -> "Map":
+        width, height = header["settings"]["map_width"], header["settings"]["map_height"]
+        type_table = [get_type_by_name(name) for name in header["type_names"]]
+
+        tiles = np.empty((width, height), dtype=object)
+        for x in range(width):  # A column at a time, so there's never a python copy of a whole array
+            columns = {field: arrays[field][x].tolist() for field in TILE_ARRAY_DTYPES}  # Plain python numbers, not numpy scalars
+            for field in NULLABLE_TILE_FIELDS:
+                columns[field] = [None if value == NULL_VALUE else value for value in columns[field]]
+            for y, (type_id, biome, height_map, quality, water, density, level, happiness, fire_ticks) in enumerate(
+                zip(arrays["type"][x].tolist(), *columns.values())
+            ):
+                tiles[x, y] = Tile(type_table[type_id], biome, height_map, quality, water, density, level, happiness, None, fire_ticks)
+
+        return Map(tiles, header["cash"], tuple(header["version"]), header["settings"])  # New tiles are already set to redraw
+
     def __repr__(self) -> str:
         return f"Map({self.version}, {self.settings})"
 
@@ -109,6 +215,7 @@ class Map:
         # if (end, start) in self.route_cache:
         #     self.route_cache[(start, end)] = self.route_cache[(end, start)][::-1]
         #     return self.route_cache[(start, end)]
+        search_start = time.perf_counter()
         matrix = np.array([
             [(self[x, y].type.name in ROADS or (x, y) in [start, end]) and self[x, y].fire_ticks is None
              for x in range(self.width)] for y in range(self.height)
@@ -119,16 +226,22 @@ class Map:
         path, _ = finder.find_path(start_node, end_node, grid)
         # self.route_cache[(start, end)] = [(node.x, node.y) for node in path]
         # return self.route_cache[(start, end)]
+        METRICS.increment("routes_computed")
+        METRICS.observe("route_seconds", time.perf_counter() - search_start)
+        if not path:
+            METRICS.increment("route_failures")
+        else:
+            METRICS.observe("route_length", len(path))
         return [(node.x, node.y) for node in path]
 
     def get_all_tiles_by_type(self, tile_type: str) -> list[COORD_TYPE] | None:
-        return [(x, y) for (x, y, _) in self.iter() if self[x, y].type.name == tile_type and self[x, y].fire_ticks is None] or None
+        return [(x, y) for x, column in enumerate(self.tiles) for y, tile in enumerate(column) if tile.type.name == tile_type and tile.fire_ticks is None] or None
 
     def get_random_tile_by_type(self, tile_type: str) -> COORD_TYPE | None:
         if tile_type == "Spawn":
             return (0, self.height // 2)
         valid_tiles = self.get_all_tiles_by_type(tile_type)
-        return choice(valid_tiles) if valid_tiles else None
+        return self.rng.choice(valid_tiles) if valid_tiles else None
 
     def get_neighbours(self, x: int, y: int) -> list[Tile]:
         neighbours: list[Tile] = []
@@ -139,13 +252,19 @@ class Map:
         return neighbours
 
     def update_neighbours(self, x: int, y: int) -> None:
-        """Recursively expand in a depth first search spreading "actively connected" too all roads"""
-        # This on very rare occasions can cause a maximum recursion depth error
+        """
+        Depth first search spreading "actively connected" to all roads. Uses its own stack rather than recursing,
+        so a long enough road can't hit the recursion limit
+        """
         self[x, y].road = 2
-        for _x, _y in get_neighbour_coords(self.width, self.height, x, y):
-            assert _x is not None and _y is not None
-            if self[_x, _y].road == 1:
-                self.update_neighbours(_x, _y)
+        to_visit = [(x, y)]
+        while to_visit:
+            x, y = to_visit.pop()
+            for _x, _y in get_neighbour_coords(self.width, self.height, x, y):
+                assert _x is not None and _y is not None
+                if self[_x, _y].road == 1:
+                    self[_x, _y].road = 2
+                    to_visit.append((_x, _y))
 
     def update_road_map(self) -> None:
         for x, y, tile in self.iter():
@@ -153,12 +272,14 @@ class Map:
         self.update_neighbours(0, self.height // 2)
 
     def check_connected(self) -> None:
+        METRICS.increment("check_connected_runs")
         self.update_road_map()
 
         for (x, y, tile) in self.iter():
             if not tile.type.need_road:
                 continue
 
+            had_errors = len(tile.error_list) > 0
             # If at least one of the neighbours is a fully connected road
             if has_connected_road(self, x, y):
                 if NO_ROAD in tile.error_list:
@@ -178,53 +299,111 @@ class Map:
                 if ROAD_NOT_CONNECTED not in tile.error_list:
                     tile.error_list.append(ROAD_NOT_CONNECTED)
 
+            if had_errors != (len(tile.error_list) > 0):
+                tile.redraw = True  # So the error square gets added or removed
+
+    def mark_changed(self, x: int, y: int) -> None:
+        """Has to be called whenever a tile's saved fields change, so the journal picks it up"""
+        if self.journal is not None:
+            self.journal.changed_tiles.add((x, y))
+
     def reset_tile(self, x: int, y: int) -> None:
         if self[x, y] is None:
             self[x, y] = Tile()
         self[x, y] = Tile(generate_tile_type(self[x, y].height_map, include_water=self.settings["generate_lakes"]), height_map=self[x, y].height_map)
+        self.mark_changed(x, y)
 
     def expand(self, direction: str = "all") -> None:
+        """
+        Adds a row or column of new tiles to one side, only the new tiles get made, and the rest of the map only gets copied
+        when storage runs out of room on that side (which gets more room than it needs, so that's rare)
+        """
         if direction == "all":
             return self.expand("left") or self.expand("right") or self.expand("top") or self.expand("bottom")  # type: ignore[no-any-return, func-returns-value]
+        if self.journal is not None:
+            self.journal.record_expand(self, direction)
+        if self.recorder is not None:
+            self.recorder.record("expand", direction)
         # === We need to move the current entry road, we replace it later on
-        self.reset_tile(0, self.height//2)
+        if self.chunk_store is None:
+            self.reset_tile(0, self.height//2)
+        else:
+            self.place_generated_tiles(0, self.height//2, 1, 1)
         # ===
-        self.settings["map_width"] += 1 if direction in ["left", "right"] else 0
-        self.settings["map_height"] += 1 if direction in ["top", "bottom"] else 0
-        self.tiles = np.pad(self.tiles, pad_width=DIRECTION_TO_COORDS[direction], mode="constant", constant_values=None)  # type: ignore[call-overload]
-        self.tiles = np.roll(self.tiles, axis=DIRECTION_TO_SHIFT[direction][0], shift=DIRECTION_TO_SHIFT[direction][1])  # type: ignore[call-overload]
-        for (x, y, tile) in self.iter():
-            if tile is None:
+        axis, end = DIRECTION_TO_EDGE[direction]
+        origin, size = list(self.origin), [self.width, self.height]
+        if (origin[axis] if end < 0 else self.storage.shape[axis] - origin[axis] - size[axis]) == 0:
+            extra = max(EXPANSION_CAPACITY, self.storage.shape[axis])  # Doubling, so copying the map is amortised over lots of expansions
+            self.storage = np.pad(self.storage, [(extra, 0) if end < 0 and axis == i else (0, extra) if axis == i else (0, 0) for i in range(2)],
+                                  mode="constant", constant_values=None)  # type: ignore[call-overload]
+            origin[axis] += extra if end < 0 else 0
+        origin[axis] -= 1 if end < 0 else 0
+        size[axis] += 1
+        self.origin = (origin[0], origin[1])
+        self.settings["map_width"], self.settings["map_height"] = size
+        self.tiles = self.storage[origin[0]:origin[0] + size[0], origin[1]:origin[1] + size[1]]
+
+        if end < 0:  # Everything already on the map moved along one
+            self.shift_coords(*((1, 0) if axis == 0 else (0, 1)))
+            world_key: Literal["world_x", "world_y"] = "world_x" if axis == 0 else "world_y"
+            self.settings[world_key] = self.settings.get(world_key, 0) - 1
+        edge = 0 if end < 0 else size[axis] - 1
+        edge_coords = [(edge, i) if axis == 0 else (i, edge) for i in range(size[1 - axis])]
+        if self.chunk_store is None:
+            for x, y in edge_coords:
                 self.reset_tile(x, y)
+        else:
+            self.place_generated_tiles(*edge_coords[0], *((1, size[1]) if axis == 0 else (size[0], 1)))
         # === We need to create a new entry road too.
         self[0, self.height//2].type = entry_road
+        self.mark_changed(0, self.height//2)
+
+    def place_generated_tiles(self, x: int, y: int, width: int, height: int) -> None:
+        """Sets the width by height area starting at (x, y) to the world's own terrain there, from the chunk store"""
+        assert self.chunk_store is not None
+        area = self.chunk_store.get_area(self.settings.get("world_x", 0) + x, self.settings.get("world_y", 0) + y, width, height)
+        for area_x, (type_ids, height_maps, waters) in enumerate(zip(area["type"].tolist(), area["height_map"].tolist(), area["water"].tolist())):
+            for area_y, (type_id, height_map, water) in enumerate(zip(type_ids, height_maps, waters)):
+                self[x + area_x, y + area_y] = Tile(get_type_by_name(TILE_TYPE_NAMES[type_id]), height_map=height_map, water=water)
+                self.mark_changed(x + area_x, y + area_y)
+
+    def shift_coords(self, x_change: int, y_change: int) -> None:
+        """Moves every coord stored outside of the tiles, after tiles have moved along in storage"""
+        # Emergency vehicles are in entity_lists too, so they only get shifted once
+        for entity in (entity for entity_list in self.entity_lists.values() for entity in entity_list):  # type: ignore[attr-defined]
+            entity.shift(x_change, y_change)
+        for service_name, coords in self.services.items():
+            self.services[service_name] = [(x + x_change, y + y_change) for x, y in coords]  # type: ignore[misc, has-type]
 
     def iter(self) -> Generator[tuple[int, int, Tile], None, None]:
         for x in range(self.width):
             for y in range(self.height):
                 yield x, y, self[x, y]
 
-    def reset_map(self, window: pygame.surface.Surface) -> tuple[int, int, list["HighlightableRectangle"]]:
+    def reset_map(self, compositor: "Compositor", camera: "Camera", recenter: bool = True, clear_entities: bool = True) -> list["HighlightableRectangle"]:
         """
         Re-checks road connections, redraw's backgrounds, regenerates expansion rectangles, clears entities and centers the map
         """
-        self.check_connected()
-        # ====
-        # Fill background in black
-        # pygame.draw.rect(window, (50, 50, 50), (0, 0, window.get_width()-ICON_SIZE, window.get_height()-ICON_SIZE))
+        if self.recorder is not None:
+            self.recorder.record("reset", clear_entities)
+        self.reset_simulation(clear_entities)
+        window = compositor.window
         if not hasattr(self, "background_image"):
             self.background_image = generate_background_image(window)
-        window.blit(self.background_image, (0, 0))
         # ====
-        x_offset = window.get_width() // 2 - (TILE_WIDTH * self.width // 2) - TILE_WIDTH  # Center the world
-        y_offset = window.get_height() // 2 - (TILE_WIDTH * self.height // 2) - TILE_WIDTH  # Center the world
+        if recenter:
+            camera.center(self, window)
         self.redraw_entire_map()
-        expansion_rectangles = generate_expansion_rectangles(self)
+        expansion_rectangles = generate_expansion_rectangles(self, camera.tile_width)
+        compositor.reset(self.background_image, expansion_rectangles, camera, self)
+        return expansion_rectangles
 
-        for entity_name in self.entity_lists.keys():
-            self.entity_lists[entity_name] = []  # type: ignore[literal-required]
-
-        return x_offset, y_offset, expansion_rectangles
+    def reset_simulation(self, clear_entities: bool = True) -> None:
+        """The part of reset_map that changes the simulation, so replays can do it without a window"""
+        self.check_connected()
+        if clear_entities:
+            for entity_name in self.entity_lists.keys():
+                self.entity_lists[entity_name] = []  # type: ignore[literal-required]
 
 
 def has_connected_road(map: Map, x: int, y: int) -> bool:
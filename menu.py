@@ -1,17 +1,18 @@
 import sys
-from os import listdir
 # from random import randint
 from typing import Any, NoReturn
 
 import pygame
 
-from file_manager import (load_game, load_preferences, save_game,
-                          save_preferences)
-from generate_world import generate_world
+from file_manager import (AUTOSAVER, SAVE_INDEX, SaveInfoType, load_game,
+                          load_preferences, save_game, save_preferences)
+from generate_world import MAX_MAP_SIZE, generate_world
 from map_object import Map
 from menu_elements import (BACK_BUTTON, Button, GoBack, IntegerSelector, Label,
-                           SliderRow, TextEntry, ToggleRow, go_back,
-                           handle_menu)
+                           SavePreview, SliderRow, TextEntry, ToggleRow,
+                           go_back, handle_menu)
+from metrics import METRICS
+from profiler import PROFILER
 from utils import DEFAULT_MAP_SETTINGS, MapSettingsType
 
 
@@ -25,24 +26,44 @@ def margins(window: pygame.surface.Surface) -> tuple[int, int, int, int]:
 # ================================================================================================================================
 
 
+save_preview_cache: dict[str, tuple[tuple[int | None, ...], SavePreview]] = {}  # Save name -> (what it was made from, preview)
+
+
+def describe_save(info: SaveInfoType) -> str:
+    metadata = info["metadata"]
+    if metadata is None:
+        return f"Old save ({info['size'] // 1024} KB), save it again for a preview"
+    buildings = metadata["buildings"]
+    return (f"{metadata['width']}x{metadata['height']}  Cash: {metadata['cash']}  "
+            f"{buildings['House']} houses, {buildings['Shop']} shops, {buildings['Office']} offices")
+
+
 def load_game_menu(window: pygame.surface.Surface, *_: Any) -> str:
     button_height = 64
     element_width, top_margin, left_margin, right_margin = margins(window)
     num_of_saves_displayed = int((window.get_height()-(window.get_height()//5))//(button_height*2))
-
-    def generate_save_slice(offset: int, num_of_saves_displayed: int) -> tuple[tuple[Button, ...], int]:
-        save_names = [file for file in sorted(listdir("saves")) if file.endswith(".simcity")]
-        save_buttons = [
-            Button(left_margin - 32, top_margin + i * (button_height * 2), element_width, button_height, save_name, lambda _, button, *_1: button.text)
-            for i, save_name in enumerate(save_names[offset : offset + num_of_saves_displayed])
-        ]
-        return tuple(save_buttons), len(save_names)
+    button_width = int(element_width * 0.4)
+
+    def generate_save_slice(offset: int, num_of_saves_displayed: int) -> tuple[tuple[Button | SavePreview, ...], int]:
+        save_names = SAVE_INDEX.get_save_names()  # Only lists the folder again if something in it changed
+        save_elements: list[Button | SavePreview] = []
+        for i, save_name in enumerate(save_names[offset : offset + num_of_saves_displayed]):
+            y = top_margin + i * (button_height * 2)
+            info = SAVE_INDEX.get_info(save_name)
+            preview_rect = (left_margin + button_width, y, element_width - button_width - 32, button_height)
+            key = (info["modified_time"], info["journal_modified_time"], *preview_rect)
+            if save_name not in save_preview_cache or save_preview_cache[save_name][0] != key:  # Making and scaling the thumbnail is slow
+                thumbnail = pygame.surfarray.make_surface(info["thumbnail"]) if info["thumbnail"] is not None else None
+                save_preview_cache[save_name] = (key, SavePreview(*preview_rect, describe_save(info), thumbnail))
+            save_elements.append(Button(left_margin - 32, y, button_width, button_height, save_name, lambda _, button, *_1: button.text))
+            save_elements.append(save_preview_cache[save_name][1])
+        return tuple(save_elements), len(save_names)
 
     offset = 0
     while True:
         # Purposefully doesn't catch GoBack so that the parent menu can catch it.
-        save_buttons, num_of_saves = generate_save_slice(offset, num_of_saves_displayed)  # Recalculate the offsetted saves each update
-        elements = [BACK_BUTTON, *save_buttons]
+        save_elements, num_of_saves = generate_save_slice(offset, num_of_saves_displayed)  # Recalculate the offsetted saves each update
+        elements = [BACK_BUTTON, *save_elements]
         if num_of_saves > num_of_saves_displayed:
             elements.append(Button(right_margin, top_margin, button_height, button_height, "^", lambda *_: max(0, offset - 1)))
             elements.append(Button(right_margin, top_margin + ((button_height * 2) * (num_of_saves_displayed-1)), button_height, button_height, "V", lambda *_: min(offset + 1, num_of_saves - 5)))
@@ -73,9 +94,9 @@ def world_settings_menu(window: pygame.surface.Surface, *_: Any) -> MapSettingsT
         IntegerSelector(left_margin, top_margin + 328, element_width, 128, "Starting cash", "starting_cash", map_settings["starting_cash"],  # fmt: skip
                         minimum=500, maximum=100_000, big_step=10000, small_step=1000, middle=50000),  # fmt: skip
         IntegerSelector(left_margin, top_margin + 456, element_width, 128, "Map Width", "map_width", map_settings["map_width"], minimum=12,
-                        maximum=96, small_step=1, big_step=10, middle=48),  # fmt: skip
+                        maximum=MAX_MAP_SIZE, small_step=1, big_step=10, middle=48),  # fmt: skip
         IntegerSelector(left_margin, top_margin + 584, element_width, 128, "Map Height", "map_height", map_settings["map_height"], minimum=12,
-                        maximum=96, small_step=1, big_step=10, middle=48),  # fmt: skip
+                        maximum=MAX_MAP_SIZE, small_step=1, big_step=10, middle=48),  # fmt: skip
         Button(left_margin, top_margin + 776, element_width, 64, "Start", lambda *_: "New game"),
     ]
 
@@ -209,7 +230,9 @@ def dev_screen(window: pygame.surface.Surface, map: Map, dev_mode: bool) -> bool
         BACK_BUTTON,
         ToggleRow(left_margin, top_margin, element_width, 64, "Dev Mode Enabled", "dev_mode", dev_mode),
         Label(f"Map width: {map.width}, height: {map.height}", left_margin, top_margin + 128, element_width, 64),
-        Label(f"Placeholder", left_margin, top_margin + 256, element_width, 64),
+        Label(PROFILER.summary(), left_margin, top_margin + 192, element_width, 64),
+        Label(AUTOSAVER.status(), left_margin, top_margin + 256, element_width, 64),
+        Label(METRICS.summary(), left_margin, top_margin + 316, element_width, 64),
         Label(f"Map seed: {map.settings['seed']}", left_margin, top_margin + 380, element_width, 64),
         Button(left_margin, top_margin + 512, element_width, 64, "Give money", on_click=lambda *_: setattr(map, "cash", 99999)),
         Button(left_margin, top_margin + 646, element_width, 64, "Expand Map", on_click=lambda *_: getattr(map, "expand")()),
@@ -1,5 +1,6 @@
 import math
 import sys
+from functools import lru_cache
 from typing import Any, Callable, NoReturn, TypeVar
 
 import pygame
@@ -8,6 +9,16 @@ from utils import DESIRED_FPS
 
 pygame.font.init()
 fonts = {size: pygame.font.SysFont("Comic Sans MS", size) for size in range(1, 120)}
+TEXT_CACHE_SIZE = 512
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(text: str, font_size: int, text_colour: tuple[int, int, int]) -> pygame.surface.Surface:
+    """
+    Renders each (text, size, colour) once, the least recently used surfaces get evicted when the cache fills up.
+    The returned surface is shared, so don't draw onto it.
+    """
+    return fonts[font_size].render(text, False, text_colour)
 
 
 class GoBack(Exception):
@@ -64,8 +75,7 @@ class Label(Element):
         self.center_y = int(y1 + height // 2)
 
     def draw(self, window: pygame.surface.Surface, horizontal_scroll_offset: int, vertical_scroll_offset: int) -> None:
-        font = fonts[self.font_size]
-        text_rendered = font.render(str(self.text), False, self.text_colour)
+        text_rendered = render_text(str(self.text), self.font_size, self.text_colour)
         text_rect = text_rendered.get_rect(center=(self.center_x+horizontal_scroll_offset, self.center_y+vertical_scroll_offset))
         window.blit(text_rendered, text_rect)
 
@@ -105,12 +115,13 @@ class IconButton(Element):
         self.size = 32
 
     def draw(self, window: pygame.surface.Surface, horizontal_scroll_offset: int, vertical_scroll_offset: int) -> None:
-        window.blit(self.icon_image, (self.x1+horizontal_scroll_offset, self.y1+vertical_scroll_offset))
+        x1, y1 = self.x1+horizontal_scroll_offset, self.y1+vertical_scroll_offset
+        window.blit(self.icon_image, (x1, y1))
         if self.is_selected:
-            pygame.draw.rect(window, (255, 255, 255), (self.x1, self.y1, self.size, 1))  # Top
-            pygame.draw.rect(window, (255, 255, 255), (self.x1, self.y1, 1, self.size))  # Left
-            pygame.draw.rect(window, (255, 255, 255), (self.x1 + self.size, self.y1, 1, self.size))  # Right
-            pygame.draw.rect(window, (255, 255, 255), (self.x1, self.y1 + self.size, self.size, 1))  # Bottom
+            pygame.draw.rect(window, (255, 255, 255), (x1, y1, self.size, 1))  # Top
+            pygame.draw.rect(window, (255, 255, 255), (x1, y1, 1, self.size))  # Left
+            pygame.draw.rect(window, (255, 255, 255), (x1 + self.size, y1, 1, self.size))  # Right
+            pygame.draw.rect(window, (255, 255, 255), (x1, y1 + self.size, self.size, 1))  # Bottom
 
 
 class BottomButton(Element):
@@ -132,23 +143,35 @@ class BottomButton(Element):
 
 
 class FadingTextBottomButton(BottomButton):
+    """
+    Shows a message over the bottom row for a second, the label is only rebuilt when the message (or size) changes
+    """
 
     def __init__(self, x1: int, y1: int, width: int, height: int, texts: list[str]) -> None:
         super().__init__(x1, y1, width, height, "")
-        self.queue = texts
+        self.frames_remaining = 0
+        for text in texts:
+            self.add_to_queue(text)
+
+    @property
+    def is_active(self) -> bool:
+        return self.frames_remaining > 0
 
     def draw(self, window: pygame.surface.Surface, horizontal_scroll_offset: int, vertical_scroll_offset: int) -> None:
-        if not self.queue:
+        if not self.is_active:
             return
+        self.frames_remaining -= 1
+        if (self.label.x1, self.label.y1, self.label.width, self.label.height) != (self.x1, self.y1, self.width, self.height):
+            self.label = Label(self.text, self.x1, self.y1, self.width, self.height, text_colour=(255, 255, 0))
         pygame.draw.rect(window, (0, 0, 0), (self.x1, self.y1, self.width, self.height))
-        label = Label(self.queue.pop(), self.x1, self.y1, self.width, self.height, text_colour=(255, 255, 0))
-        label.draw(window, horizontal_scroll_offset, vertical_scroll_offset)
+        self.label.draw(window, horizontal_scroll_offset, vertical_scroll_offset)
 
     def add_to_queue(self, text: str | None) -> None:
-        if text is None:
+        if text is None or self.is_active:
             return
-        if not self.queue:
-            self.queue.extend([text]*DESIRED_FPS*1)
+        self.text = text
+        self.frames_remaining = DESIRED_FPS*1
+        self.label = Label(self.text, self.x1, self.y1, self.width, self.height, text_colour=(255, 255, 0))
 
 
 class BottomRow(Element):
@@ -161,7 +184,7 @@ class BottomRow(Element):
         self.fading_button = fading_button
 
     def draw(self, window: pygame.surface.Surface, horizontal_scroll_offset: int, vertical_scroll_offset: int) -> None:
-        if self.fading_button.queue:
+        if self.fading_button.is_active:
             self.fading_button.x1, self.fading_button.y1 = self.x1, self.y1
             self.fading_button.width, self.fading_button.height = self.width, self.height
             self.fading_button.draw(window, 0, 0)
@@ -317,6 +340,24 @@ class TextEntry(Element):
         Label(self.text, horizontal_scroll_offset+self.x1+BORDER, vertical_scroll_offset+self.y1-6+BORDER, self.width-BORDER, self.height-BORDER).draw(window, horizontal_scroll_offset, vertical_scroll_offset)
 
 
+class SavePreview(Element):
+    """
+    Used in the load menu to show a save's thumbnail next to some facts about it
+    """
+    def __init__(self, x1: int, y1: int, width: int, height: int, text: str, thumbnail: pygame.surface.Surface | None) -> None:
+        super().__init__(x1, y1, width, height, text)
+        self.thumbnail = None
+        if thumbnail is not None:  # Scale it to fit the height, keeping its shape
+            scale = height / max(thumbnail.get_width(), thumbnail.get_height())
+            self.thumbnail = pygame.transform.scale(thumbnail, (max(1, int(thumbnail.get_width() * scale)), max(1, int(thumbnail.get_height() * scale))))
+        self.label = Label(text, x1 + height + 16, y1, width - height - 16, height)
+
+    def draw(self, window: pygame.surface.Surface, horizontal_scroll_offset: int, vertical_scroll_offset: int) -> None:
+        if self.thumbnail is not None:
+            window.blit(self.thumbnail, (self.x1+horizontal_scroll_offset, self.y1+vertical_scroll_offset))
+        self.label.draw(window, horizontal_scroll_offset, vertical_scroll_offset)
+
+
 class HighlightableRectangle(Element):
     def __init__(self, x1: int, y1: int, width: int, height: int, text: str, hovered_colour: tuple[int, int, int], unhovered_colour: tuple[int, int, int]) -> None:
         super().__init__(x1, y1, width, height, text)
@@ -0,0 +1,120 @@
+import json
+import os
+import time
+
+METRICS_INTERVAL = 10  # Seconds between dumps to the metrics file
+METRICS_PREFIX = "simcity_"  # Put in front of every name in the Prometheus file
+COUNTERS = {
+    "ticks": "Simulation ticks run",
+    "routes_computed": "Routes searched for between two tiles",
+    "route_failures": "Route searches that found no way between the two tiles",
+    "entities_rejected": "Entities thrown away while being created because their route was too short or too long",
+    "entities_spawned": "Vehicles and pedestrians created",
+    "entities_arrived": "Vehicles and pedestrians that reached the end of their route",
+    "check_connected_runs": "Times every road and building was checked for a connection to the main road",
+}
+# Upper bound of each bucket, anything bigger only goes in the +Inf bucket
+HISTOGRAMS = {
+    "route_length": ("Tiles in each route found", (5, 25, 100, 250, 500, 1000, 1500)),
+    "route_seconds": ("Seconds each route search took", (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)),
+    "tiles_redrawn": ("Tiles redrawn each frame", (0, 10, 100, 1000, 10000, 100000)),
+}
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)  # Not cumulative, unlike Prometheus's buckets
+        self.total = 0.0
+        self.count = 0
+
+    def __repr__(self) -> str:
+        return f"Histogram({self.count=}, {self.mean=})"
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Counts how much work the simulation does, like routes searched for and entities created, for the dev screen and for long
+    headless runs, where they get written to a file every METRICS_INTERVAL seconds. Everything only ever goes up, so a
+    rate is the difference between two dumps
+    """
+
+    def __init__(self) -> None:
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {name: Histogram(bounds) for name, (_, bounds) in HISTOGRAMS.items()}
+        self.start_time = time.time()
+        self.last_dump_time = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"MetricsRegistry({self.counters=})"
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def observe(self, name: str, value: float) -> None:
+        self.histograms[name].observe(value)
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "time": time.time(), "uptime": time.time() - self.start_time, "counters": dict(self.counters),
+            "histograms": {
+                name: {"bounds": histogram.bounds, "counts": histogram.counts, "sum": histogram.total, "count": histogram.count}
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+    def summary(self) -> str:
+        counters, histograms = self.counters, self.histograms
+        return (
+            f"Routes: {counters['routes_computed']} ({counters['route_failures']} failed, {histograms['route_seconds'].mean*1000:.1f}ms), "
+            f"entities: {counters['entities_spawned']} spawned, {counters['entities_rejected']} rejected, {counters['entities_arrived']} arrived, "
+            f"check_connected: {counters['check_connected_runs']}, redrawn: {histograms['tiles_redrawn'].mean:.0f} tiles a frame"
+        )
+
+    def to_prometheus(self) -> str:
+        """In Prometheus's text format, for node_exporter's textfile collector or anything else that reads it"""
+        lines = []
+        for name, value in self.counters.items():
+            full_name = f"{METRICS_PREFIX}{name}_total"
+            lines += [f"# HELP {full_name} {COUNTERS[name]}", f"# TYPE {full_name} counter", f"{full_name} {value}"]
+        for name, histogram in self.histograms.items():
+            full_name = METRICS_PREFIX + name
+            lines += [f"# HELP {full_name} {HISTOGRAMS[name][0]}", f"# TYPE {full_name} histogram"]
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f'{full_name}_bucket{{le="+Inf"}} {histogram.count}', f"{full_name}_sum {histogram.total}", f"{full_name}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """A .prom file gets replaced with the latest numbers, anything else gets a json line added to the end"""
+        self.last_dump_time = time.monotonic()
+        if path.endswith(".prom"):
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                file.write(self.to_prometheus())
+            os.replace(path + ".tmp", path)  # So nothing reading it ever sees half a file
+        else:
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(self.snapshot()) + "\n")
+
+    def update(self, path: str | None) -> None:
+        if path is not None and time.monotonic() - self.last_dump_time >= METRICS_INTERVAL:
+            self.dump(path)
+
+
+METRICS = MetricsRegistry()
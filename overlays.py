@@ -7,11 +7,17 @@ import pygame
 
 from classes import ICON_LIST, get_type_by_name
 from menu import draw_policy_screen
-from menu_elements import BottomRow, FadingTextBottomButton, IconButton
-from utils import ICON_SIZE, IMAGES
+from menu_elements import (BottomRow, FadingTextBottomButton, IconButton,
+                           render_text)
+from profiler import FRAME_PHASES
+from renderer import DIRTY_RECTS
+from utils import DESIRED_FPS, ICON_SIZE, IMAGES
 
 if TYPE_CHECKING:
     from map_object import Map
+    from profiler import FrameProfiler
+    from renderer import Compositor
+    from simulation import Simulation
     from utils import MapSettingsType
 
 
@@ -41,8 +47,24 @@ def handle_policy_change(window: pygame.surface.Surface, tool: str, draw_style:
     return tool, draw_style, icon_offset, settings
 
 
+# The side bar is only rebuilt when one of its inputs changes, it holds a single entry of the pre-rendered panel and its buttons
+side_bar_cache: dict[tuple[Any, ...], tuple[pygame.surface.Surface, list[IconButton]]] = {}
+
+
 def generate_side_bar(tool: str, draw_style: str, icon_offset: int, window: pygame.surface.Surface, settings: MapSettingsType) -> list[IconButton]:
-    pygame.draw.rect(window, (0, 0, 0), (window.get_width()-ICON_SIZE, 0, ICON_SIZE, window.get_height()))
+    key = (tool, draw_style, icon_offset, window.get_width(), window.get_height(), tuple(settings.items()))
+    if key not in side_bar_cache:
+        side_bar_cache.clear()
+        side_bar_cache[key] = render_side_bar(tool, draw_style, icon_offset, window, settings)
+        DIRTY_RECTS.add(window.get_width()-ICON_SIZE, 0, ICON_SIZE, window.get_height())
+    side_bar_surface, buttons = side_bar_cache[key]
+    window.blit(side_bar_surface, (window.get_width()-ICON_SIZE, 0))
+    return buttons
+
+
+def render_side_bar(tool: str, draw_style: str, icon_offset: int, window: pygame.surface.Surface, settings: MapSettingsType) -> tuple[pygame.surface.Surface, list[IconButton]]:
+    side_bar_surface = pygame.Surface((ICON_SIZE, window.get_height()))
+    side_bar_surface.fill((0, 0, 0))
     verticle_tiles = window.get_height() // (ICON_SIZE*2+1) - 2*3
 
     def button_press(_: pygame.surface.Surface, button: IconButton, _1: int, _2: int) -> tuple[str, str, int, MapSettingsType]:
@@ -65,28 +87,81 @@ def generate_side_bar(tool: str, draw_style: str, icon_offset: int, window: pyga
         dynamic_buttons.append(button)
 
     for element in static_buttons + dynamic_buttons:
-        element.draw(window, 0, 0)
+        element.draw(side_bar_surface, -x, 0)  # Buttons keep their window coords for collisions, so shift them onto the panel
+
+    return side_bar_surface, static_buttons + dynamic_buttons
+
 
-    return static_buttons + dynamic_buttons
+# The bottom row only gets rebuilt when its text, the fading message or the window size changes, it holds a single entry
+bottom_bar_cache: dict[tuple[str, int, int, bool, str | int], BottomRow] = {}
+BOTTOM_BAR_LIVE_INTERVAL = 500  # Milliseconds, the FPS, vehicles and run counter change nearly every frame, so they're only updated this often
+bottom_bar_live_fields = [-BOTTOM_BAR_LIVE_INTERVAL, 0, 0, 0]  # When they were last updated, FPS, vehicles, run counter
 
 
 def generate_bottom_bar(
-    window: pygame.surface.Surface, map: Map, view: str, run_counter: int, clock: pygame.time.Clock,
+    window: pygame.surface.Surface, map: Map, view: str, simulation: Simulation, clock: pygame.time.Clock,
     mouse_tile_x: int | None, mouse_tile_y: int | None, mouse_x: int | None, mouse_y: int | None,
     fading_text_element: FadingTextBottomButton,
 ) -> None:
-    bottom_row = BottomRow(
-        0, window.get_height() - ICON_SIZE, window.get_width()-ICON_SIZE, ICON_SIZE,
+    now = pygame.time.get_ticks()
+    if now - bottom_bar_live_fields[0] >= BOTTOM_BAR_LIVE_INTERVAL:
+        bottom_bar_live_fields[:] = [now, int(clock.get_fps()), len(map.entity_lists["Vehicle"]), simulation.run_counter]
+    _, fps, vehicles, run_counter = bottom_bar_live_fields
+    text = (
         f"Cash: {map.cash}  "
         f"{view.removesuffix('_view').capitalize()}  "
-        f"FPS: {int(clock.get_fps())}  "
-        f"Vehicles: {len(map.entity_lists['Vehicle'])}  "
+        f"FPS: {fps}  "
+        f"Vehicles: {vehicles}  "
         f"Run Counter: {run_counter}  "
+        f"Speed: {'Paused' if simulation.paused else simulation.speed_name}  "
         f"Coords: {mouse_x}, {mouse_y}  "
-        f"Tile: {mouse_tile_x}, {mouse_tile_y}  ",
-        fading_text_element,
+        f"Tile: {mouse_tile_x}, {mouse_tile_y}  "
     )
-    bottom_row.draw(window, 0, 0)
+    key = (text, window.get_width(), window.get_height(), fading_text_element.is_active, fading_text_element.text)
+    if key not in bottom_bar_cache:
+        bottom_bar_cache.clear()
+        bottom_bar_cache[key] = BottomRow(0, window.get_height() - ICON_SIZE, window.get_width()-ICON_SIZE, ICON_SIZE, text, fading_text_element)
+        DIRTY_RECTS.add(0, window.get_height() - ICON_SIZE, window.get_width()-ICON_SIZE, ICON_SIZE)
+    bottom_bar_cache[key].draw(window, 0, 0)
+
+
+PHASE_COLOURS = dict(zip(FRAME_PHASES, [
+    (200, 200, 200), (40, 120, 220), (0, 200, 200), (60, 200, 60), (240, 220, 40), (160, 100, 40), (120, 60, 200),
+    (230, 120, 30), (230, 60, 60), (240, 120, 200), (140, 140, 140), (255, 255, 255), (90, 90, 90),
+]))
+PROFILER_BAR_WIDTH = 2  # Pixels per frame
+PROFILER_GRAPH_HEIGHT = 200
+PROFILER_GRAPH_SCALE = PROFILER_GRAPH_HEIGHT / (2 / DESIRED_FPS)  # Pixels per second, so two frames' worth fills the graph
+PROFILER_LEGEND_WIDTH = 130
+
+
+def draw_profiler_overlay(compositor: Compositor, profiler: FrameProfiler) -> None:
+    """
+    A stacked bar for each of the last few frames, split up by phase, with a line for how long a frame can take
+    before the game drops below DESIRED_FPS, and a legend with each phase's average
+    """
+    frames = len(profiler.history[FRAME_PHASES[0]])
+    graph_width = max(profiler.history[FRAME_PHASES[0]].maxlen or 0, 1) * PROFILER_BAR_WIDTH
+    surface = pygame.Surface((graph_width + PROFILER_LEGEND_WIDTH, PROFILER_GRAPH_HEIGHT))
+    surface.fill((20, 20, 20))
+
+    for frame in range(frames):
+        bar_x = graph_width - (frames - frame) * PROFILER_BAR_WIDTH
+        bar_bottom = float(PROFILER_GRAPH_HEIGHT)
+        for phase in FRAME_PHASES:
+            bar_height = profiler.history[phase][frame] * PROFILER_GRAPH_SCALE
+            if bar_height >= 0.5:
+                pygame.draw.rect(surface, PHASE_COLOURS[phase], (bar_x, round(bar_bottom - bar_height), PROFILER_BAR_WIDTH, max(round(bar_height), 1)))
+            bar_bottom -= bar_height
+    budget_y = PROFILER_GRAPH_HEIGHT - round(PROFILER_GRAPH_SCALE / DESIRED_FPS)
+    pygame.draw.line(surface, (255, 0, 0), (0, budget_y), (graph_width, budget_y))
+
+    averages = profiler.averages()
+    surface.blit(render_text(f"Frame {sum(averages.values())*1000:.1f}ms", 12, (255, 255, 255)), (graph_width + 6, 2))
+    for i, phase in enumerate(FRAME_PHASES):
+        pygame.draw.rect(surface, PHASE_COLOURS[phase], (graph_width + 6, 22 + i * 13, 8, 8))
+        surface.blit(render_text(f"{phase} {averages[phase]*1000:.1f}", 10, (255, 255, 255)), (graph_width + 18, 18 + i * 13))
+    compositor.draw_transient(surface, (8, 8))
 
 # def generate_vignette_overlay(window: pygame.surface.Surface) -> np.ndarray[Any, Any]:
 #     from pygame.math import Vector2
@@ -0,0 +1,104 @@
+import math
+import random
+from typing import Any
+
+import numpy as np
+
+# Like PerlinNoise(octaves=2), legacy noise has 2 lattice cells across the map
+BASE_FREQUENCY = 2
+# Other noise is the same everywhere no matter the map size, with cells NOISE_CELL_SIZE tiles wide, and each layer after that has LACUNARITY times more
+NOISE_CELL_SIZE = 48
+NOISE_OCTAVES = 3
+PERSISTENCE = 0.5  # How much weaker each layer is than the one before
+LACUNARITY = 2
+
+FloatArray = np.ndarray[Any, np.dtype[np.float64]]
+
+
+def fade_value(t: float) -> float:
+    return 6 * math.pow(t, 5) - 15 * math.pow(t, 4) + 10 * math.pow(t, 3)
+
+
+# math.pow rather than numpy's, which can differ in the last bit, so legacy noise matches perlin_noise exactly.
+# It's only ever given a single row or column of distances, so doing it per value is cheap
+fade = np.vectorize(fade_value, otypes=[float])
+
+
+def gradient_noise(x: FloatArray, y: FloatArray, gradients: FloatArray, origin: tuple[int, int] = (0, 0)) -> FloatArray:
+    """
+    Perlin noise at each (x, y) in lattice units, gradients is a (lattice width, lattice height, 2) array of corner vectors,
+    starting from the corner at origin. Sums the 4 corners in the same order and the same way as the perlin_noise package,
+    so legacy noise matches it exactly
+    """
+    cell_x, cell_y = np.floor(x).astype(int), np.floor(y).astype(int)
+    total = np.zeros(np.broadcast(x, y).shape)
+    for corner_x, corner_y in [(cell_x, cell_y), (cell_x, cell_y + 1), (cell_x + 1, cell_y), (cell_x + 1, cell_y + 1)]:
+        distance_x, distance_y = x - corner_x, y - corner_y
+        weight = fade(1 - np.abs(distance_x)) * fade(1 - np.abs(distance_y))
+        gradient = gradients[corner_x - origin[0], corner_y - origin[1]]
+        total = total + weight * (gradient[..., 0] * distance_x + gradient[..., 1] * distance_y)
+    return total
+
+
+def legacy_gradients(seed: int, lattice_width: int, lattice_height: int) -> FloatArray:
+    """The corner vectors perlin_noise.PerlinNoise picks, it seeds python's random with the seed times a hash of each corner"""
+    gradients = np.zeros((lattice_width, lattice_height, 2))
+    for corner_x in range(lattice_width):
+        for corner_y in range(lattice_height):
+            corner_random = random.Random(seed * max(1, abs(corner_x + 10 * corner_y + 1)))
+            gradients[corner_x, corner_y] = [corner_random.uniform(-1, 1), corner_random.uniform(-1, 1)]
+    return gradients
+
+
+def legacy_noise(width: int, height: int, seed: int, frequency: int = BASE_FREQUENCY) -> FloatArray:
+    """The same values as PerlinNoise(octaves=frequency, seed=seed)([x/width, y/height]) for every tile, all at once"""
+    x = (np.arange(width) / width)[:, np.newaxis] * frequency
+    y = (np.arange(height) / height)[np.newaxis, :] * frequency
+    return gradient_noise(x, y, legacy_gradients(seed, frequency + 2, frequency + 2))
+
+
+def hashed_gradients(seed: int, octave: int, corner_xs: np.ndarray[Any, Any], corner_ys: np.ndarray[Any, Any]) -> FloatArray:
+    """
+    Corner vectors (each part from -1 to 1) for every corner_xs by corner_ys lattice corner, from a hash of the seed, octave and
+    corner coords, so any part of the world can be made on its own and still line up with the rest
+    """
+    corner_x, corner_y = np.meshgrid(np.asarray(corner_xs, dtype=np.int64), np.asarray(corner_ys, dtype=np.int64), indexing="ij")
+    # splitmix64, uint64 arrays wrap around on overflow which is what it wants
+    hashed = (np.full(corner_x.shape, seed % 2**64, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+              + corner_x.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F) + corner_y.astype(np.uint64) * np.uint64(0x165667B19E3779F9)
+              + np.uint64(octave))
+    hashed = (hashed ^ (hashed >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashed = (hashed ^ (hashed >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    hashed ^= hashed >> np.uint64(31)
+    halves = np.stack([hashed >> np.uint64(32), hashed & np.uint64(0xFFFFFFFF)], axis=-1)
+    return halves / 2**31 - 1
+
+
+def fractal_noise(seed: int, x: int, y: int, width: int, height: int, octaves: int = NOISE_OCTAVES) -> FloatArray:
+    """
+    The width by height area of noise starting at tile (x, y). Layers of gradient noise, each with LACUNARITY times the detail
+    and PERSISTENCE times the strength of the last, scaled so the values spread about as much as a single layer of legacy noise
+    """
+    total = np.zeros((width, height))
+    amplitudes = [PERSISTENCE ** octave for octave in range(octaves)]
+    for octave, amplitude in enumerate(amplitudes):
+        # Worked out from the tile's own coords, so it's exactly the same whichever area it's made as part of
+        lattice_x = (x + np.arange(width))[:, np.newaxis] * LACUNARITY ** octave / NOISE_CELL_SIZE
+        lattice_y = (y + np.arange(height))[np.newaxis, :] * LACUNARITY ** octave / NOISE_CELL_SIZE
+        origin = (int(np.floor(lattice_x.min())), int(np.floor(lattice_y.min())))
+        corners_x = np.arange(origin[0], int(np.floor(lattice_x.max())) + 2)
+        corners_y = np.arange(origin[1], int(np.floor(lattice_y.max())) + 2)
+        total += amplitude * gradient_noise(lattice_x, lattice_y, hashed_gradients(seed, octave, corners_x, corners_y), origin)
+    return total / np.sqrt(sum(amplitude ** 2 for amplitude in amplitudes))  # type: ignore[no-any-return]
+
+
+def generate_height_map(width: int, height: int, seed: int, legacy: bool = False, x: int = 0, y: int = 0) -> FloatArray:
+    """
+    Returns the height of every tile in the width by height area starting at tile (x, y), from -1 to 1 rounded to 2 places.
+    legacy gives the heights worlds got from the perlin_noise package (always for a whole map), so old seeds still make the same world
+    """
+    if not legacy:
+        return np.clip(fractal_noise(seed, x, y, width, height) * 3, -1, 1).round(2)
+    heights = np.clip(legacy_noise(width, height, seed) * 3, -1, 1).tolist()
+    # Python's round, which is what worlds have always used, and can differ from numpy's in the last bit
+    return np.array([[round(value, 2) for value in column] for column in heights])
@@ -0,0 +1,62 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+PROFILER_HISTORY = 120  # Frames kept, 4 seconds at DESIRED_FPS
+# In the order they happen in a frame, which is also the order they're stacked in in the graph
+FRAME_PHASES = (
+    "input", "simulation", "check_connected", "entity_move", "entity_create", "tile_timers", "random_ticks",
+    "map_draw", "entity_draw", "overlays", "ui", "saving", "display_update",
+)
+
+
+class FrameProfiler:
+    """
+    Adds up how long each phase of a frame takes, and keeps the last PROFILER_HISTORY frames of it, so it's easy to see
+    which part of the game is slow when frames start dropping. Only one phase is ever being timed: starting a phase
+    pauses the one before it, so nested phases (like the simulation's inside a frame) never get counted twice
+    """
+
+    def __init__(self, history: int = PROFILER_HISTORY) -> None:
+        self.history: dict[str, deque[float]] = {phase: deque(maxlen=history) for phase in FRAME_PHASES}
+        self.current = dict.fromkeys(FRAME_PHASES, 0.0)  # Seconds, for the frame so far
+        self.active: str | None = None
+        self.last_switch = time.perf_counter()
+
+    def __repr__(self) -> str:
+        return f"FrameProfiler({self.active=})"
+
+    def switch(self, phase: str | None) -> None:
+        """Everything from now on counts towards phase, None for time that isn't part of any (like waiting for the next frame)"""
+        now = time.perf_counter()
+        if self.active is not None:
+            self.current[self.active] += now - self.last_switch
+        self.active, self.last_switch = phase, now
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        previous = self.active
+        self.switch(phase)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def end_frame(self) -> None:
+        self.switch(None)
+        for phase, seconds in self.current.items():
+            self.history[phase].append(seconds)
+            self.current[phase] = 0.0
+
+    def averages(self) -> dict[str, float]:
+        """Each phase's average seconds per frame"""
+        return {phase: sum(times) / len(times) if times else 0.0 for phase, times in self.history.items()}
+
+    def summary(self) -> str:
+        averages = self.averages()
+        busiest = sorted(averages, key=averages.__getitem__, reverse=True)[:5]
+        return f"Frame {sum(averages.values())*1000:.1f}ms: " + ", ".join(f"{phase} {averages[phase]*1000:.1f}" for phase in busiest)
+
+
+PROFILER = FrameProfiler()
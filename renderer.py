@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pygame
+
+from classes import TILE_TYPE_NAMES, get_type_by_name
+
+if TYPE_CHECKING:
+    from camera import Camera
+    from map_object import Map
+    from menu_elements import HighlightableRectangle
+
+DIRTY_CELL_SIZE = 64  # Dirty areas get snapped to a grid of these, which merges lots of small tile updates into a few big ones
+FULL_UPDATE_RATIO = 0.4  # If more than this much of the window changed, it's cheaper to just push the whole thing
+SURROUNDINGS_MARGIN = 32  # How many tiles of the world past the map's edges get shown
+SURROUNDINGS_COLOURS = np.array([get_type_by_name(name).base_colour for name in TILE_TYPE_NAMES], dtype=np.uint8) // 2  # Dimmed
+
+
+class DirtyRects:
+    """
+    Collects the areas of the window that were drawn to this frame, so only those get pushed to the display
+    """
+
+    def __init__(self) -> None:
+        self.cells: set[tuple[int, int]] = set()
+        self.full_update = True  # The first frame always needs everything
+
+    def add(self, x: int, y: int, width: int, height: int) -> None:
+        if self.full_update or width <= 0 or height <= 0:
+            return
+        x, y, width, height = int(x), int(y), int(width), int(height)
+        for cell_x in range(max(x, 0) // DIRTY_CELL_SIZE, (x + width - 1) // DIRTY_CELL_SIZE + 1):
+            for cell_y in range(max(y, 0) // DIRTY_CELL_SIZE, (y + height - 1) // DIRTY_CELL_SIZE + 1):
+                self.cells.add((cell_x, cell_y))
+
+    def add_rect(self, rect: pygame.Rect) -> None:
+        self.add(rect.x, rect.y, rect.width, rect.height)
+
+    def mark_full(self) -> None:
+        self.full_update = True
+        self.cells.clear()
+
+    def merged_rects(self) -> list[pygame.Rect]:
+        """
+        Joins horizontal runs of dirty cells into one rect, then stacks runs with the same span in consecutive rows
+        """
+        rows: dict[int, list[int]] = {}
+        for cell_x, cell_y in self.cells:
+            rows.setdefault(cell_y, []).append(cell_x)
+
+        open_runs: dict[tuple[int, int], pygame.Rect] = {}  # (start, end) -> rect, for runs that can still grow downwards
+        rects: list[pygame.Rect] = []
+        for cell_y in sorted(rows):
+            cell_xs = sorted(rows[cell_y])
+            runs: list[tuple[int, int]] = []
+            start = previous = cell_xs[0]
+            for cell_x in cell_xs[1:]:
+                if cell_x != previous + 1:
+                    runs.append((start, previous))
+                    start = cell_x
+                previous = cell_x
+            runs.append((start, previous))
+
+            next_open_runs: dict[tuple[int, int], pygame.Rect] = {}
+            for run in runs:
+                rect = open_runs.get(run)
+                if rect is not None and rect.bottom == cell_y * DIRTY_CELL_SIZE:
+                    rect.height += DIRTY_CELL_SIZE
+                else:
+                    rect = pygame.Rect(run[0] * DIRTY_CELL_SIZE, cell_y * DIRTY_CELL_SIZE, (run[1] - run[0] + 1) * DIRTY_CELL_SIZE, DIRTY_CELL_SIZE)
+                    rects.append(rect)
+                next_open_runs[run] = rect
+            open_runs = next_open_runs
+        return rects
+
+    def update_display(self, window: pygame.surface.Surface) -> None:
+        window_area = window.get_width() * window.get_height()
+        if self.full_update or len(self.cells) * DIRTY_CELL_SIZE * DIRTY_CELL_SIZE > window_area * FULL_UPDATE_RATIO:
+            pygame.display.update()
+        elif self.cells:
+            window_rect = window.get_rect()
+            pygame.display.update([rect.clip(window_rect) for rect in self.merged_rects()])
+        self.full_update = False
+        self.cells.clear()
+
+
+DIRTY_RECTS = DirtyRects()
+
+
+class Compositor:
+    """
+    Keeps the map in cached layers, so things that change every frame never force tiles to be redrawn.
+    - terrain: the background, tiles and expansion rectangles, only drawn to when something there changes
+    - status: fire and error squares, redrawn alongside their tile
+    - transient: drag squares, hover squares and entities, drawn straight onto the window and wiped next frame
+      by restoring the cached layers underneath them
+    - UI: the side and bottom bars, drawn on top of everything else by the caller
+    When zoomed far out, tiles set their colour in `lod_colours` instead, and the visible part gets drawn as one scaled blit.
+    Worlds with terrain past their edges have it drawn dimmed around the map, under the expansion rectangles.
+    """
+
+    def __init__(self, window: pygame.surface.Surface) -> None:
+        self.window = window
+        self.terrain = pygame.Surface(window.get_size())
+        self.status = pygame.Surface(window.get_size(), pygame.SRCALPHA)
+        self.transient_rects: list[pygame.Rect] = []  # Everything drawn on top of the layers last frame
+        self.lod_colours: np.ndarray[tuple[int, int, int], np.dtype[np.uint8]] = np.zeros((0, 0, 3), dtype=np.uint8)
+        self.lod_changed = False
+
+    def reset(self, background_image: pygame.surface.Surface, expansion_rectangles: list[HighlightableRectangle], camera: Camera, map: Map | None = None) -> None:
+        if self.terrain.get_size() != self.window.get_size():
+            self.terrain = pygame.Surface(self.window.get_size())
+            self.status = pygame.Surface(self.window.get_size(), pygame.SRCALPHA)
+        self.terrain.fill((0, 0, 0))
+        self.terrain.blit(background_image, (0, 0))
+        if map is not None and map.chunk_store is not None:
+            self.draw_surroundings(map, camera)
+        self.status.fill((0, 0, 0, 0))
+        for rectangle in expansion_rectangles:
+            rectangle.draw(self.terrain, camera.x_offset, camera.y_offset)
+        self.transient_rects = []
+        self.window.blit(self.terrain, (0, 0))
+        DIRTY_RECTS.mark_full()
+
+    def draw_surroundings(self, map: Map, camera: Camera) -> None:
+        """
+        Draws the on screen part of the world around the map, up to SURROUNDINGS_MARGIN tiles past its edges, from the chunk store,
+        so that's the only part that ever gets generated. The map's own tiles get drawn over the middle of it
+        """
+        assert map.chunk_store is not None
+        first_x = max(-camera.x_offset // camera.tile_width, -SURROUNDINGS_MARGIN)
+        first_y = max(-camera.y_offset // camera.tile_width, -SURROUNDINGS_MARGIN)
+        last_x = min((self.window.get_width() - camera.x_offset) // camera.tile_width + 1, map.width + SURROUNDINGS_MARGIN)
+        last_y = min((self.window.get_height() - camera.y_offset) // camera.tile_width + 1, map.height + SURROUNDINGS_MARGIN)
+        if first_x >= last_x or first_y >= last_y:
+            return
+        area = map.chunk_store.get_area(map.settings.get("world_x", 0) + first_x, map.settings.get("world_y", 0) + first_y, last_x - first_x, last_y - first_y)
+        colour_surface = pygame.surfarray.make_surface(SURROUNDINGS_COLOURS[area["type"]])
+        colour_surface = pygame.transform.scale(colour_surface, ((last_x - first_x) * camera.tile_width, (last_y - first_y) * camera.tile_width))
+        self.terrain.blit(colour_surface, camera.coords_to_screen_pos(first_x, first_y))
+
+    def restore(self, rect: pygame.Rect) -> None:
+        """Copies the cached layers back onto the window"""
+        self.window.blit(self.terrain, rect, rect)
+        self.window.blit(self.status, rect, rect)
+        DIRTY_RECTS.add_rect(rect)
+
+    def begin_frame(self) -> None:
+        """Wipes last frame's transient drawing"""
+        for rect in self.transient_rects:
+            self.restore(rect)
+        self.transient_rects = []
+
+    def draw_transient(self, image: pygame.surface.Surface, pos: tuple[int, int]) -> None:
+        rect = self.window.blit(image, pos)
+        self.transient_rects.append(rect)
+        DIRTY_RECTS.add_rect(rect)
+
+    def draw_static(self, image: pygame.surface.Surface, pos: tuple[int, int]) -> None:
+        """Draws onto the terrain layer, so it stays there until the tile underneath gets redrawn"""
+        self.restore(self.terrain.blit(image, pos))
+
+    def set_lod_colour(self, map: Map, x: int, y: int, colour: tuple[int, int, int]) -> None:
+        if self.lod_colours.shape[:2] != (map.width, map.height):
+            self.lod_colours = np.zeros((map.width, map.height, 3), dtype=np.uint8)
+        self.lod_colours[x, y] = colour
+        self.lod_changed = True
+
+    def draw_lod(self, camera: Camera, map: Map) -> None:
+        """Draws the on screen part of the colour array, if any of it changed this frame"""
+        if not self.lod_changed:
+            return
+        self.lod_changed = False
+        first_x, first_y, last_x, last_y = camera.visible_tiles(map, self.window)
+        if first_x >= last_x or first_y >= last_y:
+            return
+        colour_surface = pygame.surfarray.make_surface(self.lod_colours[first_x:last_x, first_y:last_y])
+        colour_surface = pygame.transform.scale(colour_surface, ((last_x - first_x) * camera.tile_width, (last_y - first_y) * camera.tile_width))
+        rect = self.terrain.blit(colour_surface, camera.coords_to_screen_pos(first_x, first_y))
+        self.status.fill((0, 0, 0, 0), rect)
+        self.restore(rect)
@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import zlib
+from typing import Any
+
+from classes import get_type_by_name
+from file_manager import (HEADER_LENGTH, PreferencesType, decode_save,
+                          encode_save, save_game)
+from map_object import Map
+from simulation import Simulation
+
+# A replay is REPLAY_MAGIC, the header length as a little endian uint32, a zlib compressed json header, then the world as it was
+# when recording started, as a binary save. The header has everything else the simulation needs to start from the same place,
+# how many ticks each Simulation.tick ran (as [count, times in a row] pairs) and every player action as [tick, op, *args]:
+# [tick, "tool", tool, [[x, y], ...]]   - Using a tool on some tiles, with the same tool names as the side bar
+# [tick, "fire", x, y]
+# [tick, "settings", settings]          - Settings changed from the side bar, merged into the map's
+# [tick, "cash", cash]                  - Cash set by the player, like expanding or giving money in the dev menu
+# [tick, "preferences", preferences]
+# [tick, "pause"]
+# [tick, "expand", direction]           - Recorded by the map itself
+# [tick, "reset", clear_entities]       - Recorded by the map itself, see Map.reset_simulation
+REPLAY_MAGIC = b"SIMREPLY"
+MAP_RECORDED_OPS = ("expand", "reset")  # apply_action doesn't record these, or they'd be recorded twice
+REPLAY_FORMAT_VERSION = 1
+
+
+def replay_path(replay_name: str) -> str:
+    return "replays/" + replay_name + ".replay"
+
+
+def state_hash(map: Map, simulation: Simulation) -> str:
+    """A hash of everything the simulation's state is made of, two runs only ever have the same hash if they ended up the same"""
+    hasher = hashlib.md5()
+    _, arrays = map.to_arrays()
+    for name, array in arrays.items():
+        hasher.update(name.encode("utf-8") + array.tobytes())
+    entities = [(name, entity.entity_subtype, entity.current_loc, entity.end, entity.path)
+                for name, entity_list in map.entity_lists.items() for entity in entity_list]  # type: ignore[attr-defined]
+    hasher.update(repr((map.cash, map.settings, simulation.run_counter, entities, map.rng.getstate())).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class Recorder:
+    """
+    Records every player action with the tick it happened on, from a copy of the world taken when recording started,
+    so the whole session can be played back without a window and end up exactly the same
+    """
+
+    def __init__(self, replay_name: str, base: bytes, header: dict[str, Any]) -> None:
+        self.replay_name = replay_name
+        self.base = base
+        self.header = header
+        self.tick = 0
+        self.tick_counts: list[list[int]] = []  # [count, times in a row]
+        self.actions: list[list[Any]] = []
+
+    def __repr__(self) -> str:
+        return f"Recorder({self.replay_name=}, {self.tick=}, {len(self.actions)=})"
+
+    def record_ticks(self, count: int) -> None:
+        if self.tick_counts and self.tick_counts[-1][0] == count:
+            self.tick_counts[-1][1] += 1
+        else:
+            self.tick_counts.append([count, 1])
+        self.tick += count
+
+    def record(self, op: str, *args: Any) -> None:
+        self.actions.append([self.tick, op, *args])
+
+    def save(self, map: Map, simulation: Simulation) -> str:
+        header = self.header | {"ticks": self.tick, "tick_counts": self.tick_counts, "actions": self.actions, "end_hash": state_hash(map, simulation)}
+        header_bytes = zlib.compress(json.dumps(header).encode("utf-8"))
+        os.makedirs("replays", exist_ok=True)
+        with open(replay_path(self.replay_name), "wb") as file:
+            file.write(b"".join([REPLAY_MAGIC, HEADER_LENGTH.pack(len(header_bytes)), header_bytes, self.base]))
+        print(f"replay: Saved {self.replay_name}, {self.tick} ticks and {len(self.actions)} actions")
+        return self.replay_name
+
+
+def start_recording(map: Map, simulation: Simulation) -> Map:
+    """
+    Returns a copy of the map, made from the same save the replay starts from, for the game to carry on with, so the game and the
+    replay start from exactly the same state. Entities and anything else that isn't saved start again from scratch
+    """
+    base = encode_save(*map.to_arrays())
+    seed = random.getrandbits(32)
+    header = {
+        "format": REPLAY_FORMAT_VERSION, "seed": seed, "run_counter": simulation.run_counter,
+        "paused": simulation.paused, "preferences": simulation.preferences,
+        "ticks_until_check_connected": simulation.ticks_until_check_connected,
+    }
+    new_map = Map.from_arrays(*decode_save(base))
+    new_map.rng.seed(seed)
+    new_map.journal, map.journal = map.journal, None
+    new_map.recorder = Recorder(time.strftime("%Y-%m-%d_%H-%M-%S"), base, header)
+    simulation.map = new_map
+    print(f"replay: Recording {new_map.recorder.replay_name}")
+    return new_map
+
+
+def stop_recording(map: Map, simulation: Simulation) -> str | None:
+    """Saves the replay being recorded, if there is one, and returns its name"""
+    if map.recorder is None:
+        return None
+    replay_name = map.recorder.save(map, simulation)
+    map.recorder = None
+    return replay_name
+
+
+def apply_action(map: Map, simulation: Simulation, op: str, *args: Any) -> list[str]:
+    """
+    Does a player action, recording it if there's a recording going. The game does every action that changes the simulation
+    through here, so replaying one does exactly the same thing. Returns any messages for the player
+    """
+    if map.recorder is not None and op not in MAP_RECORDED_OPS:
+        map.recorder.record(op, *args)
+    messages: list[str] = []
+    if op == "tool":
+        tool, coords = args
+        for x, y in coords:
+            message = None
+            if tool == "select":
+                map[x, y].type.on_random_tick(map, x, y)
+            elif tool == "destroy":
+                message = map[x, y].type.on_destroy(map, x, y)
+            else:
+                message = get_type_by_name(tool).on_place(map, x, y)
+            if message is not None:
+                messages.append(message)
+            map[x, y].error_list = []
+        map.check_connected()
+    elif op == "fire":
+        x, y = args
+        map[x, y].fire_ticks = 1
+        map.mark_changed(x, y)
+        map[x, y].redraw = True
+    elif op == "settings":
+        map.settings = map.settings | args[0]
+    elif op == "cash":
+        map.cash = args[0]
+    elif op == "preferences":
+        simulation.preferences = args[0]
+    elif op == "pause":
+        simulation.paused = not simulation.paused
+    elif op == "expand":
+        map.expand(args[0])
+    elif op == "reset":
+        map.reset_simulation(args[0])
+    return messages
+
+
+def load_replay(replay_name: str) -> tuple[dict[str, Any], Map]:
+    with open(replay_path(replay_name), "rb") as file:
+        data = file.read()
+    if not data.startswith(REPLAY_MAGIC):
+        raise ValueError(f"replay: {replay_name} isn't a replay")
+    header_start = len(REPLAY_MAGIC) + HEADER_LENGTH.size
+    (header_length,) = HEADER_LENGTH.unpack_from(data, len(REPLAY_MAGIC))
+    header = json.loads(zlib.decompress(data[header_start : header_start + header_length]))
+    if header["format"] > REPLAY_FORMAT_VERSION:
+        raise ValueError(f"replay: replay format {header['format']} is newer than this game supports ({REPLAY_FORMAT_VERSION})")
+    map = Map.from_arrays(*decode_save(data[header_start + header_length:]))
+    map.rng.seed(header["seed"])
+    return header, map
+
+
+def run_replay(replay_name: str, save_as: str | None = None) -> bool:
+    """Plays a replay back as fast as possible, returns whether it ended up exactly where the recording did"""
+    header, map = load_replay(replay_name)
+    preferences: PreferencesType = header["preferences"]
+    simulation = Simulation(map, preferences, header["run_counter"])
+    simulation.paused = header["paused"]
+    simulation.ticks_until_check_connected = header.get("ticks_until_check_connected", 0)
+    actions = iter(header["actions"])
+    action = next(actions, None)
+
+    start = time.perf_counter()
+    tick = 0
+    for count, times in [*header["tick_counts"], [0, 1]]:  # The extra empty tick is for the actions after the last tick
+        for _ in range(times):
+            while action is not None and action[0] == tick:
+                apply_action(simulation.map, simulation, action[1], *action[2:])
+                action = next(actions, None)
+            if count:
+                simulation.tick(count=count)
+                tick += count
+    elapsed = time.perf_counter() - start
+
+    matches: bool = state_hash(simulation.map, simulation) == header["end_hash"]
+    print(f"replay: Played {replay_name}, {tick} ticks and {len(header['actions'])} actions in {elapsed:.2f}s, "
+          f"{tick / elapsed if elapsed else float('inf'):.0f} ticks/s")
+    print(f"replay: {'Ended in the same state as the recording' if matches else 'Ended in a DIFFERENT state to the recording'}")
+    if save_as is not None:
+        save_game(simulation.map, save_as)
+    return matches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plays back a recorded game without a window, to check it still ends up the same and time it")
+    parser.add_argument("replay", help="Replay name in replays/, without .replay")
+    parser.add_argument("--save-as", default=None, help="Save the city under this name afterwards")
+    args = parser.parse_args()
+    sys.exit(0 if run_replay(args.replay, args.save_as) else 1)
@@ -0,0 +1,172 @@
+import argparse
+import sys
+import time
+from typing import Literal
+
+from entities import Pedestrian, Vehicle
+from file_manager import (BASE_PREFERENCES, PreferencesType, load_game,
+                          save_game)
+from map_object import Map
+from metrics import METRICS
+from profiler import PROFILER
+from utils import DESIRED_FPS, TICK_RATE
+
+ENTITIES_TO_CREATE_PER_TICK = 2
+TICK_LENGTH = 1 / DESIRED_FPS  # Seconds of game time in a tick, the game always moves on by exactly this much per tick
+MAX_TICKS_PER_FRAME = 5  # How many ticks a slow frame can catch up on before the next one gets drawn, times the game speed
+MAX_BACKLOG = 0.25  # Seconds, anything further behind than this is dropped, so a long stall can't leave the city racing to catch up
+GAME_SPEEDS: tuple[int | None, ...] = (1, 2, 4, None)  # Ticks per tick of real time, None is as fast as it can go
+MAX_SPEED_FRAME_TIME = 1 / DESIRED_FPS  # At max speed, ticks are run for this long each frame before it gets drawn
+MAX_SPEED_BATCH = 5  # Ticks run together at max speed between checking the time
+CHECK_CONNECTED_TICKS = DESIRED_FPS * 3  # Once a second
+
+
+class Simulation:
+    """
+    Steps a map forward one tick at a time: road connections, entities moving and being created, heatmap and fire timers,
+    and random ticks. It never draws anything, so the game only has to draw what changed afterwards
+    """
+
+    def __init__(self, map: Map, preferences: PreferencesType, run_counter: int = 0) -> None:
+        self.map = map
+        self.preferences = preferences
+        self.run_counter = run_counter
+        self.paused = False  # Entities stop and the run counter stops counting, everything else carries on
+        self.backlog = 0.0  # Seconds of game time that haven't been simulated yet
+        self.speed: int | None = GAME_SPEEDS[0]
+        self.ticks_until_check_connected = 0  # Counts down even when paused, so the first tick always checks
+
+    def __repr__(self) -> str:
+        return f"Simulation({self.run_counter=}, {self.paused=}, {self.backlog=}, {self.speed=})"
+
+    @property
+    def speed_name(self) -> str:
+        return "Max" if self.speed is None else f"{self.speed}x"
+
+    def advance(self, elapsed: float, redraw_heatmap: bool = False) -> int:
+        """
+        Runs however many whole ticks fit in the real time that's passed (in seconds) at the current speed, carrying the rest over
+        to next time, so the city moves at the same speed however fast it's being drawn. Returns how many ticks were run.
+        While paused it runs at 1x whatever the speed, only the timers and random ticks carry on then, and they shouldn't race
+        """
+        speed = 1 if self.paused else self.speed
+        if speed is None:
+            self.backlog = 0.0
+            ticks = 0
+            stop_at = time.perf_counter() + MAX_SPEED_FRAME_TIME
+            while ticks == 0 or time.perf_counter() < stop_at:
+                self.tick(redraw_heatmap, count=MAX_SPEED_BATCH)
+                ticks += MAX_SPEED_BATCH
+            return ticks
+
+        self.backlog = min(self.backlog + elapsed * speed, MAX_BACKLOG * speed)
+        ticks = min(int(self.backlog / TICK_LENGTH), MAX_TICKS_PER_FRAME * speed)
+        if ticks:
+            self.tick(redraw_heatmap, count=ticks)
+        self.backlog -= ticks * TICK_LENGTH
+        return ticks
+
+    def tick(self, redraw_heatmap: bool = False, count: int = 1) -> None:
+        """
+        Runs count ticks, redraw_heatmap is for when the heatmap is being shown, so tiles get redrawn as their heat changes.
+        The heatmap and fire timers of every tile are only gone over once for all of them, that's most of a tick on big maps
+        """
+        map = self.map
+        if map.recorder is not None:
+            map.recorder.record_ticks(count)
+        METRICS.increment("ticks", count)
+        self.ticks_until_check_connected -= count
+        if self.ticks_until_check_connected <= 0:  # At most once a batch, however many seconds it covers
+            self.ticks_until_check_connected = CHECK_CONNECTED_TICKS
+            with PROFILER.phase("check_connected"):
+                map.check_connected()  # Update any roads that are not connected to the main road network, and also check any buildings not on roads
+
+        heatmap_ticks = 0
+        for _ in range(count):
+            if not self.paused:  # If the game is paused, don't move or create entities
+                for entity_type in [Vehicle, Pedestrian]:
+                    self.update_entities(entity_type)
+
+            if self.run_counter % 4:  # Only update the heatmap 3 in every 4 ticks so it doesn't decrease too quickly.
+                heatmap_ticks += 1
+            if not self.paused:
+                self.run_counter += 1
+
+        with PROFILER.phase("tile_timers"):
+            for x, y, tile in map.iter():
+                if heatmap_ticks and tile.vehicle_heatmap > 0:
+                    tile.vehicle_heatmap = max(tile.vehicle_heatmap - heatmap_ticks, 0)
+                    if redraw_heatmap:
+                        tile.redraw = True
+
+                if tile.fire_ticks is not None:
+                    tile.fire_ticks += count
+                    map.mark_changed(x, y)
+
+        with PROFILER.phase("random_ticks"):
+            for _ in range(TICK_RATE * count):
+                x, y = map.rng.randint(0, map.width-1), map.rng.randint(0, map.height-1)  # randint excludes the last number, so we need to do -1
+                map[x, y].type.on_random_tick(map, x, y)
+
+    def update_entities(self, entity_type: type[Vehicle] | type[Pedestrian]) -> None:
+        entity_name: Literal["Vehicle", "Pedestrian"] = entity_type.__name__  # type: ignore[assignment]
+        entity_list: list[Vehicle] | list[Pedestrian] = self.map.entity_lists[entity_name]
+
+        # MOVE
+        if self.run_counter % entity_type.speed == 0:
+            with PROFILER.phase("entity_move"):
+                for entity in entity_list:
+                    new_pos = entity.update(self.map, entity_list)  # type: ignore[arg-type]
+                    if new_pos is None:
+                        entity.on_arrive(self.map)
+                        METRICS.increment("entities_arrived")
+                    else:
+                        self.map[new_pos].vehicle_heatmap = min(self.map[new_pos].vehicle_heatmap + 2 * DESIRED_FPS, 255)  # Heatmap
+
+        # CREATE
+        with PROFILER.phase("entity_create"):
+            for _ in range(ENTITIES_TO_CREATE_PER_TICK):
+                if len(entity_list) < self.preferences["max_" + ("vehicles" if entity_name == "Vehicle" else "pedestrians")]:  # type: ignore[literal-required]
+                    route_type = self.map.rng.choice(["residential", "commercial", "industrial"])
+                    entity_type.try_create(entity_type, self.map, route_type, rainbow_entities_enabled=self.preferences["rainbow_entities"])
+
+
+def run_headless(save_name: str, ticks: int, seed: int | None = None, save_as: str | None = None, metrics_path: str | None = None) -> Simulation:
+    """
+    Loads a save (ignoring its journal, so the save itself is never touched) and runs it for a number of ticks as fast as possible,
+    writing the metrics to metrics_path every so often and at the end, if there is one
+    """
+    map = load_game(save_name, attach_journal=False)
+    if seed is not None:
+        map.rng.seed(seed)
+    simulation = Simulation(map, BASE_PREFERENCES)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        simulation.tick()
+        PROFILER.end_frame()  # A tick is a "frame" here, so the profiler's averages are per tick
+        METRICS.update(metrics_path)
+    elapsed = time.perf_counter() - start
+
+    print(f"simulation: Ran {save_name} for {ticks} ticks ({ticks * TICK_LENGTH:.0f}s of game time) in {elapsed:.2f}s, "
+          f"{ticks / elapsed if elapsed else float('inf'):.0f} ticks/s")
+    print(f"simulation: Slowest parts of the last {len(PROFILER.history['input'])} ticks, {PROFILER.summary()}")
+    print(f"simulation: {len(map.entity_lists['Vehicle'])} vehicles, {len(map.entity_lists['Pedestrian'])} pedestrians, cash {map.cash}")
+    print(f"simulation: {METRICS.summary()}")
+    if metrics_path is not None:
+        METRICS.dump(metrics_path)
+    if save_as is not None:
+        save_game(map, save_as)
+    return simulation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a city without a window for benchmarks and soak tests, run from the game's folder")
+    parser.add_argument("save", help="Save file name in saves/")
+    parser.add_argument("--ticks", type=int, default=DESIRED_FPS * 60, help="How many ticks to run, defaults to a minute of game time")
+    parser.add_argument("--seed", type=int, default=None, help="Seeds the random ticks and traffic, otherwise they're seeded with the world's seed")
+    parser.add_argument("--save-as", default=None, help="Save the city under this name afterwards")
+    parser.add_argument("--metrics", default=None, help="Write the metrics here every so often, as Prometheus text if it ends in .prom, otherwise as json lines")
+    args = parser.parse_args()
+    run_headless(args.save, args.ticks, args.seed, args.save_as, args.metrics)
+    sys.exit(0)
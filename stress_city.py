@@ -0,0 +1,163 @@
+import argparse
+import math
+import random
+import sys
+from typing import Any
+
+import numpy as np
+
+from classes import (GenericTile, fire_station, hospital, house_zoning,
+                     office_zoning, park, police_station, road, shop_zoning)
+from file_manager import save_game
+from generate_world import MAX_MAP_SIZE, generate_world
+from map_object import Map
+from utils import DEFAULT_MAP_SETTINGS, MapSettingsType
+
+BoolArray = np.ndarray[Any, np.dtype[np.bool_]]
+
+LAYOUTS = ("grid", "radial", "maze")
+STRESS_SIZES = (64, 128, 256)  # Up to MAX_MAP_SIZE, the biggest world the menu makes, bigger ones need --oversize
+BLOCK_SIZE = 4  # Tiles from one road to the next, so the blocks in between are BLOCK_SIZE-1 wide
+ZONE_MIX = (house_zoning, house_zoning, shop_zoning, office_zoning)  # Each block is zoned as one of these
+SERVICES = (fire_station, hospital, police_station, park)
+SERVICE_AREA = 24  # One of each service in every SERVICE_AREA by SERVICE_AREA square
+MIN_RADIAL_SPOKES = 8
+
+
+def draw_road_line(roads: BoolArray, start: tuple[int, int], end: tuple[int, int]) -> None:
+    """Marks a straight line of road, stepping across then down on diagonals so every tile is joined to the last by a side"""
+    (x1, y1), (x2, y2) = start, end
+    steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+    last_y = y1
+    for step in range(steps + 1):
+        x, y = round(x1 + (x2 - x1) * step / steps), round(y1 + (y2 - y1) * step / steps)
+        for road_x, road_y in [(x, last_y), (x, y)]:
+            if 0 <= road_x < roads.shape[0] and 0 <= road_y < roads.shape[1]:
+                roads[road_x, road_y] = True
+        last_y = y
+
+
+def grid_roads(width: int, height: int, block_size: int, rng: random.Random) -> BoolArray:
+    """Every block_size'th row and column, lined up with the entry road"""
+    xs, ys = np.arange(width)[:, np.newaxis], np.arange(height)[np.newaxis, :]
+    return (xs % block_size == 1) | ((ys % block_size == height // 2 % block_size) & (xs > 0))  # type: ignore[no-any-return]
+
+
+def radial_roads(width: int, height: int, block_size: int, rng: random.Random) -> BoolArray:
+    """Rings around the middle of the map, 2 blocks apart, and spokes out from it, one of which goes to the entry road"""
+    roads = np.zeros((width, height), dtype=bool)
+    centre = (width // 2, height // 2)
+    max_radius = math.hypot(width, height) / 2
+    for radius in range(block_size * 2, int(max_radius), block_size * 2):
+        points = max(8, round(2 * math.pi * radius / 4))
+        corners = [(round(centre[0] + radius * math.cos(2 * math.pi * i / points)), round(centre[1] + radius * math.sin(2 * math.pi * i / points)))
+                   for i in range(points + 1)]
+        for start, end in zip(corners, corners[1:]):
+            draw_road_line(roads, start, end)
+    spokes = max(MIN_RADIAL_SPOKES, min(width, height) // (block_size * 4))
+    for i in range(spokes):
+        angle = math.pi + 2 * math.pi * i / spokes  # The first spoke points left, at the entry road
+        draw_road_line(roads, centre, (round(centre[0] + max_radius * math.cos(angle)), round(centre[1] + max_radius * math.sin(angle))))
+    draw_road_line(roads, (1, height // 2), centre)
+    return roads
+
+
+def maze_roads(width: int, height: int, block_size: int, rng: random.Random) -> BoolArray:
+    """
+    A maze joining points block_size apart, so there's exactly one way between any two of them, which makes the longest routes
+    of any layout. Made with a depth first search that picks its next step at random
+    """
+    roads = np.zeros((width, height), dtype=bool)
+    columns, rows = list(range(1, width, block_size)), list(range(height // 2 % block_size, height, block_size))
+    start = (0, rows.index(height // 2))  # Next to the entry road
+    visited = {start}
+    to_visit = [start]
+    while to_visit:
+        cell_x, cell_y = to_visit[-1]
+        options = [(cell_x + x_change, cell_y + y_change) for x_change, y_change in [(0, -1), (1, 0), (0, 1), (-1, 0)]
+                   if 0 <= cell_x + x_change < len(columns) and 0 <= cell_y + y_change < len(rows) and (cell_x + x_change, cell_y + y_change) not in visited]
+        if not options:
+            to_visit.pop()
+            continue
+        next_x, next_y = rng.choice(options)
+        draw_road_line(roads, (columns[cell_x], rows[cell_y]), (columns[next_x], rows[next_y]))
+        visited.add((next_x, next_y))
+        to_visit.append((next_x, next_y))
+    return roads
+
+
+ROAD_LAYOUTS = {"grid": grid_roads, "radial": radial_roads, "maze": maze_roads}
+
+
+def place_tiles(map: Map, coords: list[tuple[int, int]], tile_types: list[GenericTile]) -> None:
+    """Sets each coord's tile type straight away, without any of on_place's costs or checks"""
+    for (x, y), tile_type in zip(coords, tile_types):
+        map[x, y].type = tile_type
+        map.mark_changed(x, y)
+
+
+def build_stress_city(layout: str, size: int, seed: int = 1, block_size: int = BLOCK_SIZE, grown: float = 1.0) -> Map:
+    """
+    A size by size world with a layout's roads, every tile next to a road zoned, services spread out over it,
+    and grown fraction of the connected zones already turned into buildings
+    """
+    map_settings: MapSettingsType = DEFAULT_MAP_SETTINGS | {
+        "map_width": size, "map_height": size, "seed": seed, "generate_lakes": False, "generate_ruins": False,
+    }
+    map = generate_world(map_settings)
+    rng = random.Random(seed)
+
+    roads = ROAD_LAYOUTS[layout](size, size, block_size, rng)
+    roads[0, :] = False  # The entry road's column
+    next_to_road = np.zeros_like(roads)
+    next_to_road[1:] |= roads[:-1]
+    next_to_road[:-1] |= roads[1:]
+    next_to_road[:, 1:] |= roads[:, :-1]
+    next_to_road[:, :-1] |= roads[:, 1:]
+    next_to_road &= ~roads
+    next_to_road[0, :] = False
+
+    place_tiles(map, [(int(x), int(y)) for x, y in zip(*np.nonzero(roads))], [road] * int(roads.sum()))
+    block_zones = {}
+    zone_coords = [(int(x), int(y)) for x, y in zip(*np.nonzero(next_to_road))]
+    for x, y in zone_coords:
+        block = (x // block_size, y // block_size)
+        if block not in block_zones:
+            block_zones[block] = rng.choice(ZONE_MIX)
+    place_tiles(map, zone_coords, [block_zones[x // block_size, y // block_size] for x, y in zone_coords])
+
+    areas: dict[tuple[int, int], list[tuple[int, int]]] = {}
+    for x, y in zone_coords:
+        areas.setdefault((x // SERVICE_AREA, y // SERVICE_AREA), []).append((x, y))
+    for area_coords in areas.values():
+        for service, (x, y) in zip(SERVICES, rng.sample(area_coords, min(len(SERVICES), len(area_coords)))):
+            map.cash += service.cost or 0  # Placed the way a player would, but for free
+            service.on_place(map, x, y)
+
+    map.check_connected()
+    for x, y in zone_coords:
+        zone = map[x, y].type
+        if zone in ZONE_MIX and map[x, y].road >= 2 and rng.random() < grown:
+            place_tiles(map, [(x, y)], [zone.turns_to])
+    return map
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds test cities to see how the game scales, saved as Stress_<layout>_<size>.simcity, run from the game's folder")
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=LAYOUTS, help="Road layouts to build")
+    parser.add_argument("--sizes", type=int, nargs="+", default=STRESS_SIZES, help="Map widths (and heights) to build each layout at")
+    parser.add_argument("--seed", type=int, default=1, help="Seeds the terrain, zones and service positions")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Tiles from one road to the next")
+    parser.add_argument("--grown", type=float, default=1.0, help="Fraction of connected zones that start as buildings")
+    parser.add_argument("--oversize", action="store_true", help=f"Allow sizes over {MAX_MAP_SIZE}, which the game has never been tested at and are slow to build")
+    args = parser.parse_args()
+    if max(args.sizes) > MAX_MAP_SIZE and not args.oversize:
+        parser.error(f"sizes over {MAX_MAP_SIZE} (the biggest world the menu makes) need --oversize")
+    for layout in args.layouts:
+        for size in args.sizes:
+            city = build_stress_city(layout, size, args.seed, args.block_size, args.grown)
+            save_game(city, f"Stress_{layout}_{size}.simcity")
+            if city.journal is not None:
+                city.journal.close()
+            print(f"stress_city: Saved Stress_{layout}_{size}.simcity")
+    sys.exit(0)
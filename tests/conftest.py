@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+
+import pygame
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # The game loads its images and saves relative to its own folder
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame.display.init()
+pygame.display.set_mode((1, 1))  # Images get converted for the display as they're loaded, so there has to be one
+
+SAVE_NAMES = sorted(name for name in os.listdir(os.path.join(ROOT, "saves")) if name.endswith(".simcity") and not name.startswith("Autosave_"))
+
+
+@pytest.fixture
+def scratch_folder(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> str:
+    """Runs the test from an empty saves folder, so its saves, journals and replays never touch the real ones"""
+    os.mkdir(os.path.join(tmp_path, "saves"))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def copy_save(save_name: str, new_name: str | None = None) -> None:
+    """Copies one of the game's saves into the scratch folder's saves"""
+    shutil.copy(os.path.join(ROOT, "saves", save_name), os.path.join("saves", new_name or save_name))
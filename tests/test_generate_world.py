@@ -0,0 +1,54 @@
+import hashlib
+from typing import Any
+
+import pytest
+
+from generate_world import generate_world
+from map_object import Map
+from utils import DEFAULT_MAP_SETTINGS
+
+# Fingerprints of the worlds the original tile by tile generator (with the perlin_noise package) made for these settings,
+# old seeds have to keep making exactly the same world
+LEGACY_WORLDS: list[tuple[dict[str, Any], str]] = [
+    ({"seed": 1}, "f8a027dca9a22e9774aa8df0a8ed8e20"),
+    ({"seed": 12, "map_width": 30, "map_height": 20}, "a5c68da3fe4b48c30f4fea2e5f973dde"),
+    ({"seed": 77, "map_width": 64, "map_height": 40, "tree_density": 30}, "e0258b7838055d09e82a0449d3e5b7d7"),
+    ({"seed": 5, "generate_biomes": False}, "394f5a32abac2a1572bc19135b896089"),
+    ({"seed": 9, "generate_lakes": False, "generate_ruins": False}, "99962ae8d9eff6cfc0eb886c84ceb8ce"),
+]
+# The same worlds after expanding left, top, right then bottom, with the original np.pad and np.roll expand
+EXPANDED_LEGACY_WORLDS = [
+    "71acd52ec7d3156033ee9559dfe72346", "6b2c9339f2e88cb802526876013518a7", "421e387f7dd51d769939f7a248abf448",
+    "fdd5592d02a77e4a1d62188dfe0a1eec", "47126b8abf94efeee1b153450b526f4f",
+]
+
+
+def fingerprint(map: Map) -> str:
+    """A hash of every tile's saved fields, heights as floats since the original generator made some of them ints"""
+    tiles = [
+        (tile.type.name, float(tile.height_map), tile.water, tile.quality, tile.density, tile.level, tile.happiness, tile.fire_ticks)
+        for tile in (map[x, y] for x in range(map.width) for y in range(map.height))
+    ]
+    return hashlib.md5(repr((map.width, map.height, tiles)).encode("utf-8")).hexdigest()
+
+
+@pytest.mark.parametrize("settings, expected", LEGACY_WORLDS)
+def test_legacy_worlds_match_the_original_generator(settings: dict[str, Any], expected: str) -> None:
+    map = generate_world(DEFAULT_MAP_SETTINGS | {"legacy_generation": True} | settings)  # type: ignore[arg-type]
+    assert fingerprint(map) == expected
+
+
+@pytest.mark.parametrize("settings, expected", [(settings, expected) for (settings, _), expected in zip(LEGACY_WORLDS, EXPANDED_LEGACY_WORLDS)])
+def test_expanding_matches_the_original_expand(settings: dict[str, Any], expected: str) -> None:
+    map = generate_world(DEFAULT_MAP_SETTINGS | {"legacy_generation": True} | settings)  # type: ignore[arg-type]
+    for direction in ["left", "top", "right", "bottom"]:
+        map.expand(direction)
+    assert fingerprint(map) == expected
+
+
+def test_expanding_past_the_spare_storage() -> None:
+    """24 expansions to the left, more than EXPANSION_CAPACITY, so the storage has to grow on that side at least once"""
+    map = generate_world(DEFAULT_MAP_SETTINGS | {"legacy_generation": True, "seed": 3, "map_width": 20, "map_height": 20})
+    for i in range(60):
+        map.expand(["left", "top", "left", "bottom", "right"][i % 5])
+    assert fingerprint(map) == "b47c9b70e2f8fec7582679f77f7e5eb6"
@@ -0,0 +1,58 @@
+import os
+
+from classes import road
+from conftest import copy_save
+from file_manager import BASE_PREFERENCES, load_game, save_game
+from journal import journal_path
+from simulation import Simulation
+from test_save_format import assert_same_world
+
+
+def test_saving_into_the_journal_matches_a_full_save(scratch_folder: str) -> None:
+    copy_save("SmolWorld.simcity")
+    save_game(load_game("SmolWorld.simcity"), "SmolWorld.simcity")  # A binary save, so saving again only appends to its journal
+    map = load_game("SmolWorld.simcity")
+    simulation = Simulation(map, BASE_PREFERENCES)
+
+    road.on_place(map, 5, 5)
+    map.expand("left")  # Tiles changed before it are recorded with their old coords
+    map[3, 3].fire_ticks = 1
+    map.mark_changed(3, 3)
+    map.cash += 7
+    save_game(map, "SmolWorld.simcity")
+    simulation.tick(count=10)  # Nothing but the simulation changes the fire's timer after that save
+    save_game(map, "SmolWorld.simcity")
+
+    assert os.path.exists(journal_path("SmolWorld.simcity"))
+    assert_same_world(map, load_game("SmolWorld.simcity", attach_journal=False))
+    save_game(map, "Full.simcity")
+    assert_same_world(load_game("Full.simcity", attach_journal=False), load_game("SmolWorld.simcity", attach_journal=False))
+
+
+def test_quitting_without_saving_throws_changes_away(scratch_folder: str) -> None:
+    copy_save("SmolWorld.simcity")
+    save_game(load_game("SmolWorld.simcity"), "SmolWorld.simcity")
+    map = load_game("SmolWorld.simcity")
+    cash = map.cash
+    road.on_place(map, 5, 5)
+    map.cash += 7
+
+    reloaded = load_game("SmolWorld.simcity", attach_journal=False)
+    assert map[5, 5].type.name == "Road" and reloaded[5, 5].type.name != "Road"
+    assert reloaded.cash == cash
+
+
+def test_expanding_more_than_once_between_saves(scratch_folder: str) -> None:
+    """Every settings op keeps the size from when it was made, not the size at the next save"""
+    copy_save("SmolWorld.simcity")
+    save_game(load_game("SmolWorld.simcity"), "SmolWorld.simcity")
+    map = load_game("SmolWorld.simcity")
+    for direction in ["left", "left", "top", "right"]:
+        map.expand(direction)
+    save_game(map, "SmolWorld.simcity")
+
+    reloaded = load_game("SmolWorld.simcity")
+    assert (reloaded.settings["map_width"], reloaded.settings["map_height"]) == reloaded.tiles.shape
+    assert_same_world(map, reloaded)
+    save_game(reloaded, "SmolWorld.simcity")  # Used to fail, as the settings didn't match the tiles
+    assert_same_world(map, load_game("SmolWorld.simcity", attach_journal=False))
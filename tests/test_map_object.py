@@ -0,0 +1,43 @@
+from collections import deque
+
+import pytest
+
+from classes import ROADS, road
+from generate_world import generate_world
+from map_object import Map
+from stress_city import LAYOUTS, build_stress_city, place_tiles
+from utils import DEFAULT_MAP_SETTINGS, get_neighbour_coords
+
+
+def connected_roads(map: Map) -> set[tuple[int, int]]:
+    """The simplest possible version of update_road_map, a breadth first search out from the entry road"""
+    start = (0, map.height // 2)
+    connected, to_visit = {start}, deque([start])
+    while to_visit:
+        x, y = to_visit.popleft()
+        for _x, _y in get_neighbour_coords(map.width, map.height, x, y):
+            assert _x is not None and _y is not None
+            if (_x, _y) not in connected and map[_x, _y].type.name in ROADS:
+                connected.add((_x, _y))
+                to_visit.append((_x, _y))
+    return connected
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_update_road_map_matches_a_breadth_first_search(layout: str) -> None:
+    map = build_stress_city(layout, 64)
+    map.update_road_map()
+    assert {(x, y) for x, y, tile in map.iter() if tile.road == 2} == connected_roads(map)
+
+
+def test_update_road_map_follows_roads_longer_than_the_recursion_limit() -> None:
+    """A road snaking over every other column, far longer than the 1500 deep recursion the search used to need"""
+    size = 64
+    map = generate_world(DEFAULT_MAP_SETTINGS | {"map_width": size, "map_height": size, "generate_lakes": False, "generate_ruins": False})
+    coords = [(1, y) for y in range(size // 2, size)]
+    for x in range(1, size - 1, 2):
+        coords += [(x, y) for y in range(size)] + [(x + 1, 0 if x % 4 == 3 else size - 1)]  # Down a column, then across to the next
+    place_tiles(map, coords, [road] * len(coords))
+    map.update_road_map()
+    assert len(set(coords)) > 1500
+    assert all(map[x, y].road == 2 for x, y in coords)
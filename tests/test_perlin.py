@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from perlin import fractal_noise, legacy_noise
+
+
+@pytest.mark.parametrize("width, height, seed", [(48, 48, 1), (30, 20, 12), (64, 40, 77), (13, 97, 123456)])
+def test_legacy_noise_matches_perlin_noise_exactly(width: int, height: int, seed: int) -> None:
+    """Old worlds have to generate exactly as they did with the perlin_noise package, down to the last bit"""
+    perlin_noise = pytest.importorskip("perlin_noise")
+    noise = perlin_noise.PerlinNoise(octaves=2, seed=seed)
+    expected = np.array([[noise([x / width, y / height]) for y in range(height)] for x in range(width)])
+    assert np.array_equal(legacy_noise(width, height, seed), expected)
+
+
+@pytest.mark.parametrize("x, y", [(37, 21), (-20, -5), (0, 0)])
+def test_fractal_noise_lines_up_across_areas(x: int, y: int) -> None:
+    """An area made on its own is exactly the same as that part of a bigger area, so chunks join up without seams"""
+    whole = fractal_noise(3, -40, -40, 140, 130)
+    assert np.array_equal(fractal_noise(3, x, y, 30, 50), whole[x + 40 : x + 70, y + 40 : y + 90])
@@ -0,0 +1,46 @@
+from typing import Any
+
+from conftest import copy_save
+from file_manager import BASE_PREFERENCES, load_game
+from replay import (apply_action, run_replay, start_recording, state_hash,
+                    stop_recording)
+from simulation import Simulation
+
+
+def run(seed: int, tick_counts: list[int]) -> str:
+    map = load_game("Maze.simcity", attach_journal=False)
+    map.rng.seed(seed)
+    simulation = Simulation(map, BASE_PREFERENCES)
+    for count in tick_counts:
+        simulation.tick(count=count)
+    return state_hash(map, simulation)
+
+
+def test_the_same_seed_always_ends_in_the_same_state() -> None:
+    tick_counts = [1] * 30 + [5] * 10 + [3] * 5
+    assert run(1, tick_counts) == run(1, tick_counts)
+    assert run(1, tick_counts) != run(2, tick_counts)
+
+
+def test_a_replay_ends_in_the_recorded_state(scratch_folder: str) -> None:
+    copy_save("Maze.simcity")
+    map = load_game("Maze.simcity", attach_journal=False)
+    simulation = Simulation(map, BASE_PREFERENCES)
+    simulation.tick(count=40)  # Recording starts part way through, with the road check countdown part way down
+    map = start_recording(map, simulation)
+
+    house = next((x, y) for x, y, tile in map.iter() if tile.type.name == "House")
+    grass = [(x, y) for x, y, tile in map.iter() if tile.type.name == "Grass"][:3]
+    actions: list[tuple[int, str, tuple[Any, ...]]] = [
+        (1, "tool", ("road", grass)), (5, "fire", house), (3, "pause", ()), (5, "pause", ()),
+        (2, "cash", (12345,)), (4, "tool", ("destroy", grass[:1])), (5, "expand", ("left",)),
+    ]
+    for count, op, args in actions:
+        for _ in range(5):
+            simulation.tick(count=count)
+        apply_action(map, simulation, op, *args)
+    simulation.tick(count=30)
+    replay_name = stop_recording(map, simulation)
+
+    assert replay_name is not None
+    assert run_replay(replay_name)
@@ -0,0 +1,39 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ROOT, SAVE_NAMES, copy_save
+from file_manager import decode_save, encode_save, load_game, save_game
+from map_object import TILE_ARRAY_DTYPES, Map
+
+
+def assert_same_world(first: Map, second: Map) -> None:
+    assert (first.cash, first.settings, tuple(first.version)) == (second.cash, second.settings, tuple(second.version))  # Json saves load it as a list
+    first_arrays, second_arrays = first.to_arrays()[1], second.to_arrays()[1]
+    assert first_arrays.keys() == second_arrays.keys()
+    for name, array in first_arrays.items():
+        assert np.array_equal(array, second_arrays[name]), name
+
+
+@pytest.mark.parametrize("save_name", SAVE_NAMES)
+def test_binary_round_trip_keeps_every_tile(save_name: str) -> None:
+    """Every save, loaded from json, encoded and decoded again, has the same tiles as the json it started as"""
+    with open(os.path.join(ROOT, "saves", save_name), "r", encoding="utf-8") as file:
+        raw = json.load(file)
+    map = Map.from_arrays(*decode_save(encode_save(*load_game(save_name, attach_journal=False).to_arrays())))
+
+    assert (map.cash, map.settings, map.width, map.height) == (raw["cash"], raw["settings"], len(raw["tiles"]), len(raw["tiles"][0]))
+    for x, column in enumerate(raw["tiles"]):
+        for y, tile in enumerate(column):
+            assert map[x, y].type.name == tile["type"]
+            assert all(getattr(map[x, y], field) == tile[field] for field in TILE_ARRAY_DTYPES), (x, y)
+
+
+@pytest.mark.parametrize("save_name", ["SmolWorld.simcity", "NaturalCity.simcity", "AAARectangl.simcity"])
+def test_save_game_then_load_game(scratch_folder: str, save_name: str) -> None:
+    copy_save(save_name)
+    map = load_game(save_name, attach_journal=False)
+    save_game(map, "Copy.simcity")
+    assert_same_world(map, load_game("Copy.simcity", attach_journal=False))
@@ -2,9 +2,9 @@ from __future__ import annotations
 
 import random
 from os import listdir
-from random import choice
-from typing import TYPE_CHECKING, Generator, TypedDict
+from typing import TYPE_CHECKING, Any, Generator, TypedDict
 
+import numpy as np
 import pygame
 
 if TYPE_CHECKING:
@@ -33,6 +33,9 @@ class MapSettingsType(TypedDict):
     residential_tax_rate: int
     commercial_tax_rate: int
     industrial_tax_rate: int
+    legacy_generation: bool  # Generate exactly how worlds used to be, worlds made before there was a choice don't have this
+    world_x: int  # Where the map's top left tile is in the endless world it was generated from, it moves as the map expands
+    world_y: int
 
 
 DEFAULT_MAP_SETTINGS: MapSettingsType = {
@@ -47,6 +50,9 @@ DEFAULT_MAP_SETTINGS: MapSettingsType = {
     "residential_tax_rate": 10,
     "commercial_tax_rate": 10,
     "industrial_tax_rate": 10,
+    "legacy_generation": False,
+    "world_x": 0,
+    "world_y": 0,
 }
 
 
@@ -87,8 +93,8 @@ with open("name_list.txt", "r", encoding="utf-8") as file:
     people_names = file.read().split("\n")
 
 
-def get_random_name() -> str:
-    return choice(people_names)
+def get_random_name(rng: random.Random) -> str:
+    return rng.choice(people_names)
 
 
 def clip(num: int | float, minimum: int, maximum: int) -> int:
@@ -105,6 +111,48 @@ def get_neighbour_coords(map_width: int, map_height: int, x: int, y: int, includ
     return neighbours
 
 
+def neighbour_totals(field: np.ndarray[Any, np.dtype[Any]]) -> tuple[np.ndarray[Any, np.dtype[Any]], np.ndarray[Any, np.dtype[Any]]]:
+    """Convolves a (width, height) field with the 4 NEIGHBOURS, returns each tile's neighbour total and how many neighbours it has"""
+    padded = np.pad(field, 1)
+    counts = np.pad(np.ones(field.shape, dtype=int), 1)
+    totals, neighbour_counts = np.zeros_like(field), np.zeros(field.shape, dtype=int)
+    for x_neigh, y_neigh in NEIGHBOURS:
+        window = (slice(1 + x_neigh, padded.shape[0] - 1 + x_neigh), slice(1 + y_neigh, padded.shape[1] - 1 + y_neigh))
+        totals += padded[window]
+        neighbour_counts += counts[window]
+    return totals, neighbour_counts
+
+
+def smooth_field(field: np.ndarray[Any, np.dtype[Any]], passes: int, minimum: int, maximum: int, sweep: bool = True) -> np.ndarray[Any, np.dtype[Any]]:
+    """
+    Sets every tile of an int (width, height) field to the average of its neighbours (from get_neighbour_coords), clipped and truncated, passes times.
+    sweep updates tiles in place in x then y order like a loop over the map would, so tiles see the ones before them already smoothed,
+    without it every tile is smoothed at once from the last pass
+    """
+    field = field.astype(np.int64)  # Copy, and room for big starting values
+    if not sweep:
+        for _ in range(passes):
+            totals, neighbour_counts = neighbour_totals(field)
+            field = np.clip(totals / neighbour_counts, minimum, maximum).astype(np.int64)
+        return field
+
+    # Each tile only depends on the one before it in x and y, so a whole diagonal (x + y the same) can be done at once,
+    # using a 0 border so edge tiles can index their void neighbours
+    width, height = field.shape
+    stride = height + 2
+    padded = np.pad(field, 1).ravel()
+    _, neighbour_counts = neighbour_totals(field)
+    counts = np.pad(neighbour_counts, 1, constant_values=1).ravel()
+    x, y = np.indices(field.shape)
+    order = np.argsort((x + y).ravel(), kind="stable")
+    diagonals = np.split(((x + 1) * stride + y + 1).ravel()[order], np.cumsum([min(d + 1, width, height, width + height - 1 - d) for d in range(width + height - 2)]))
+    for _ in range(passes):
+        for tiles in diagonals:
+            totals = padded[tiles - stride] + padded[tiles + stride] + padded[tiles - 1] + padded[tiles + 1]
+            padded[tiles] = np.clip(totals / counts[tiles], minimum, maximum)
+    return padded.reshape(width + 2, height + 2)[1:-1, 1:-1]
+
+
 def get_neighbouring_road_string(map: Map, x: int, y: int) -> str:
     neighbours = get_neighbour_coords(map.width, map.height, x, y, include_void_tiles=True)
     neighbouring_roads = "".join(["0" if (_x is None or not map[_x, _y].road) else "1" for (_x, _y) in neighbours])  # type: ignore[index]
@@ -138,16 +186,4 @@ def get_class_properties(cls: object) -> list[str]:
     return [i for i in dir(cls) if not i.startswith("_") and i not in ["to_dict", "from_dict"]]
 
 
-def convert_mouse_pos_to_coords(x: int, y: int, x_offset: int, y_offset: int, map: Map, window: pygame.surface.Surface) -> tuple[int, int] | tuple[None, None]:
-    if x is None or y is None or x > (window.get_width() - ICON_SIZE*1.5) or y > (window.get_height() - ICON_SIZE*1.5):
-        return None, None
-    tile_x, tile_y = (x-x_offset) // TILE_WIDTH, (y-y_offset) // TILE_WIDTH
-    if not (0 <= tile_x < map.width and 0 <= tile_y < map.height):
-        return None, None
-    return tile_x, tile_y
-
-
-def coords_to_screen_pos(x: int, y: int, x_offset: int, y_offset: int) -> tuple[int, int]:
-    return ((x * TILE_WIDTH)+x_offset, (y * TILE_WIDTH)+y_offset)
-
 # ================================================================================================